@@ -0,0 +1,114 @@
+"""Measure per-trial overhead of the sweep agent.
+
+Trials run a no-op training, which only writes the info file. The overhead is the time spent by the agent
+on sampling, launching, fetching and reporting. Process and persistent worker modes are measured.
+For the process mode, the start-up time of the same command without the agent is reported as the baseline.
+
+Usage:
+    python benchmarks/agent_overhead.py [--trials 50] [--method bayes] [--output result.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from common import BENCHMARKS_ROOT, ROOT, measure, use_local_stores, write_report
+
+
+TRAIN_COMMAND = [sys.executable, "-c", "import agent_overhead; agent_overhead.train()"]
+WORKER_COMMAND = [sys.executable, "-m", "venik", "worker", "agent_overhead:train"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Measure per-trial overhead of the sweep agent")
+    parser.add_argument("--trials", type=int, default=50, help="The number of trials in each mode")
+    parser.add_argument("--method", default="bayes", help="Sweep method")
+    parser.add_argument("--store", help="Folder for MLflow and Optuna databases (default: temporary)")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def train(args=None):
+    """No-op training, which reports a constant metric."""
+    with open(os.environ["MLFLOW_INFO_FILE"], "w") as fp:
+        json.dump({"run_id": os.environ["BENCHMARK_RUN_ID"], "metrics": {"loss": 0.0}}, fp)
+
+
+def create_sweep(root, name, method, worker):
+    from venik.sweep import init_sweep
+    from venik.utils import get_sweep_db
+
+    config = {
+        "project": "benchmark",
+        "name": name,
+        "run_cap": 1,
+        "method": method,
+        "metric": {"name": "loss", "goal": "minimize"},
+        "parameters": {"lr": {"min": 0.0001, "max": 0.1}},
+        "command": ["${env}"] + (WORKER_COMMAND if worker else TRAIN_COMMAND),
+        "worker": worker
+    }
+    path = os.path.join(root, f"{name}.yaml")
+    with open(path, "w") as fp:
+        yaml.safe_dump(config, fp)
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        init_sweep(argparse.Namespace(config=path))
+    sweeps = get_sweep_db().get_sweeps_list(project="benchmark")
+    return [sweep["sweep_id"] for sweep in sweeps if sweep["name"] == name][-1]
+
+
+def run_agent(sweep_id, trials):
+    from mlflow.tracking import MlflowClient
+    from venik.agent import main, parse_arguments
+    from venik.timings import get_summary
+    from venik.utils import get_sweep_db
+
+    start = time.perf_counter()
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        main(parse_arguments([sweep_id, "--count", str(trials)]))
+    duration = time.perf_counter() - start
+    client = MlflowClient(os.environ["MLFLOW_TRACKING_URI"])
+    summary = get_summary(client, get_sweep_db().get_sweep_config(sweep_id)["_parent_mlflow_run_id_"])
+    return {
+        "seconds": duration,
+        "seconds_per_trial": duration / trials,
+        "phases": {key: values["mean"] for key, values in summary.items() if key.startswith("timing/")}
+    }
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.store or tmp
+        use_local_stores(root)
+        from mlflow.tracking import MlflowClient
+        import optuna
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+        # All trials report to the same run.
+        client = MlflowClient(os.environ["MLFLOW_TRACKING_URI"])
+        experiment = client.get_experiment_by_name("benchmark")
+        experiment_id = experiment.experiment_id if experiment is not None else client.create_experiment("benchmark")
+        os.environ["BENCHMARK_RUN_ID"] = client.create_run(experiment_id, run_name="benchmark-trials").info.run_id
+        os.environ["PYTHONPATH"] = os.pathsep.join([BENCHMARKS_ROOT, ROOT, os.environ.get("PYTHONPATH", "")])
+
+        env = dict(os.environ, MLFLOW_INFO_FILE=os.path.join(root, "baseline.json"))
+        baseline = measure(lambda: subprocess.run(TRAIN_COMMAND, env=env, check=True), min(args.trials, 10))
+        results = {"baseline": {"seconds_per_trial": baseline["median"]}}
+        for mode in ["process", "worker"]:
+            sweep_id = create_sweep(root, mode, args.method, worker=(mode == "worker"))
+            results[mode] = run_agent(sweep_id, args.trials)
+        results["process"]["overhead_per_trial"] = (results["process"]["seconds_per_trial"]
+                                                    - results["baseline"]["seconds_per_trial"])
+        results["worker"]["overhead_per_trial"] = results["worker"]["seconds_per_trial"]
+    write_report(args.output, "agent_overhead", vars(args), results)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
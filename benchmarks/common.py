@@ -0,0 +1,79 @@
+"""Helpers for benchmarks, which run against local SQLite stores."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_ROOT = os.path.dirname(os.path.abspath(__file__))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def use_local_stores(root):
+    """Point MLflow and Optuna to SQLite databases in the folder.
+
+    Must be called before venik creates storages, as they are cached.
+    """
+    os.makedirs(root, exist_ok=True)
+    os.environ["MLFLOW_TRACKING_URI"] = "sqlite:///" + os.path.join(os.path.abspath(root), "mlflow.db")
+    os.environ["OPTUNA_STORAGE"] = "sqlite:///" + os.path.join(os.path.abspath(root), "optuna.db")
+
+
+def get_environment():
+    """Get versions for comparing results between releases."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    environment = {"commit": commit, "python": platform.python_version(), "platform": platform.platform()}
+    for name in ["mlflow", "optuna", "sqlalchemy"]:
+        try:
+            environment[name] = __import__(name).__version__
+        except ImportError:
+            environment[name] = None
+    return environment
+
+
+def measure(function, repeats):
+    """Call the function multiple times and summarize durations in seconds."""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        "count": len(durations),
+        "mean": statistics.mean(durations),
+        "median": statistics.median(durations),
+        "p95": durations[min(int(0.95 * len(durations)), len(durations) - 1)],
+        "min": durations[0],
+        "max": durations[-1]
+    }
+
+
+def write_report(path, name, parameters, results):
+    report = {
+        "benchmark": name,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": get_environment(),
+        "parameters": parameters,
+        "results": results
+    }
+    text = json.dumps(report, indent=2)
+    if path is None:
+        print(text)
+    else:
+        with open(path, "w") as fp:
+            fp.write(text + "\n")
+    return report
@@ -0,0 +1,100 @@
+"""Measure throughput of gather and plot on synthetic MLflow stores.
+
+Gather is measured with YAML files, SQLite and Parquet outputs (requires pyarrow).
+A store with the given number of finished runs is generated for each size through the MLflow client, which takes
+about 50ms per run. Generated stores are kept in the --store folder and are reused by next calls.
+The incremental gather is measured on the second pass, when all runs are unchanged.
+
+Usage:
+    python benchmarks/export_throughput.py [--runs 1000 10000 100000] [--store DIR] [--output result.json]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+from common import write_report
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Measure gather and plot throughput")
+    parser.add_argument("--runs", type=int, nargs="+", default=[1000], help="Store sizes")
+    parser.add_argument("--experiments", type=int, default=4, help="The number of experiments")
+    parser.add_argument("--params", type=int, default=20, help="The number of parameters per run")
+    parser.add_argument("--metrics", type=int, default=5, help="The number of metrics per run")
+    parser.add_argument("--steps", type=int, default=20, help="The number of steps in each metric history")
+    parser.add_argument("--jobs", type=int, default=8, help="The number of concurrent requests")
+    parser.add_argument("--store", help="Folder for generated stores (default: temporary)")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def generate_store(path, args, n_runs):
+    """Create the SQLite MLflow store with synthetic runs."""
+    from mlflow.entities import Metric, Param
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient("sqlite:///" + path)
+    experiment_ids = [client.create_experiment(f"experiment-{i}") for i in range(args.experiments)]
+    timestamp = int(time.time() * 1000)
+    for i in range(n_runs):
+        run = client.create_run(experiment_ids[i % len(experiment_ids)], run_name=f"run-{i}")
+        params = [Param(f"param_{j}", str(i * j)) for j in range(args.params)]
+        metrics = [Metric(f"metric_{j}", (i + j) / (step + 1), timestamp + step, step)
+                   for j in range(args.metrics) for step in range(args.steps)]
+        client.log_batch(run.info.run_id, params=params, metrics=metrics)
+        client.set_terminated(run.info.run_id, "FINISHED")
+        if (i + 1) % 1000 == 0:
+            print(f"Generated {i + 1} of {n_runs} runs", file=sys.stderr)
+
+
+def run_command(module, argv):
+    """Run the command and return its duration in seconds."""
+    start = time.perf_counter()
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        module.main(module.parse_arguments(argv))
+    return time.perf_counter() - start
+
+
+def main(args):
+    from venik import gather, plot
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        store_root = args.store or tmp
+        os.makedirs(store_root, exist_ok=True)
+        for n_runs in args.runs:
+            name = f"runs{n_runs}-e{args.experiments}-p{args.params}-m{args.metrics}-s{args.steps}"
+            path = os.path.abspath(os.path.join(store_root, name + ".db"))
+            result = {}
+            if not os.path.exists(path):
+                start = time.perf_counter()
+                if os.path.exists(path + ".tmp"):
+                    # Interrupted generation.
+                    os.remove(path + ".tmp")
+                generate_store(path + ".tmp", args, n_runs)
+                os.rename(path + ".tmp", path)
+                result["generate_seconds"] = time.perf_counter() - start
+            os.environ["MLFLOW_TRACKING_URI"] = "sqlite:///" + path
+
+            target = os.path.join(tmp, f"export-{n_runs}")
+            jobs = ["--jobs", str(args.jobs)]
+            result["gather_seconds"] = run_command(gather, ["run-", os.path.join(target, "gather")] + jobs)
+            gather_target = os.path.join(target, "gather-incremental")
+            run_command(gather, ["run-", gather_target, "--incremental"] + jobs)
+            result["gather_incremental_seconds"] = run_command(gather, ["run-", gather_target, "--incremental"] + jobs)
+            for output_format in ["sqlite", "parquet"]:
+                result[f"gather_{output_format}_seconds"] = run_command(
+                    gather, ["run-", os.path.join(target, output_format), "--format", output_format] + jobs)
+            result["plot_seconds"] = run_command(plot, ["run-", "metric_0", os.path.join(target, "plot")] + jobs)
+            for key in ["gather", "gather_sqlite", "gather_parquet", "plot"]:
+                result[f"{key}_runs_per_second"] = n_runs / result[f"{key}_seconds"]
+            results[str(n_runs)] = result
+    write_report(args.output, "export_throughput", vars(args), results)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
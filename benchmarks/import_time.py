@@ -0,0 +1,82 @@
+"""Guard start-up time of venik commands.
+
+Each command is started in a fresh interpreter. The script fails if a command imports
+heavy dependencies before they are needed or if it starts slower than the threshold.
+
+Usage:
+    python benchmarks/import_time.py [--threshold 1.0] [--repeats 5] [--output result.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules, which must not be imported at start-up.
+HEAVY_MODULES = ["mlflow", "optuna", "pytorch_lightning", "torch"]
+
+# Import targets and CLI subcommands, which don't train anything.
+IMPORTS = ["venik", "venik.cli", "venik.sweep", "venik.agent", "venik.list_sweeps",
+           "venik.api", "venik.gather", "venik.plot", "venik.worker", "venik.timings", "venik.status",
+           "venik.sync"]
+COMMANDS = ["sweep", "agent", "list", "api", "gather", "plot", "worker", "timings", "status", "sync"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Measure import time of venik modules and commands")
+    parser.add_argument("--threshold", type=float, default=1.0, help="Maximum start-up time in seconds")
+    parser.add_argument("--repeats", type=int, default=5, help="The number of measurements (the best is used)")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def measure(cmd, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run(cmd, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        duration = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Command failed: {cmd}")
+        best = duration if best is None else min(best, duration)
+    return best, result.stdout
+
+
+def main(args):
+    report = {"threshold": args.threshold, "imports": {}, "commands": {}}
+    failures = []
+    check = "import sys, json; print(json.dumps([m for m in {} if m in sys.modules]))".format(HEAVY_MODULES)
+    for module in IMPORTS:
+        duration, stdout = measure([sys.executable, "-c", f"import {module}; {check}"], args.repeats)
+        heavy = json.loads(stdout)
+        report["imports"][module] = {"seconds": duration, "heavy_modules": heavy}
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)}")
+        if duration > args.threshold:
+            failures.append(f"{module} import takes {duration:.2f}s")
+    for command in COMMANDS:
+        duration, _ = measure([sys.executable, "-m", "venik", command, "--help"], args.repeats)
+        report["commands"][command] = {"seconds": duration}
+        if duration > args.threshold:
+            failures.append(f"venik {command} starts in {duration:.2f}s")
+    report["failures"] = failures
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    for kind in ["imports", "commands"]:
+        for name, values in report[kind].items():
+            print(f"{name}: {values['seconds']:.3f}s")
+    for failure in failures:
+        print("FAIL:", failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
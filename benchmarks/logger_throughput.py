@@ -0,0 +1,62 @@
+"""Measure MLFlowLogger.log_metrics calls per second.
+
+The logger is measured with synchronous requests, asynchronous logging and spool mode.
+Finalization time includes flushing pending records.
+
+Usage:
+    python benchmarks/logger_throughput.py [--steps 1000] [--metrics 10] [--output result.json]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import use_local_stores, write_report
+
+
+MODES = ["sync", "async", "spool"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Measure MLFlowLogger throughput")
+    parser.add_argument("--steps", type=int, default=1000, help="The number of log_metrics calls")
+    parser.add_argument("--metrics", type=int, default=10, help="The number of metrics in each call")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="Logging modes")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def run(mode, root, steps, n_metrics):
+    from venik import MLFlowLogger
+
+    logger = MLFlowLogger(experiment_name="benchmark",
+                          run_name=f"logger-{mode}",
+                          async_logging=(mode == "async"),
+                          spool_dir=os.path.join(root, "spool") if mode == "spool" else None)
+    # Create the run.
+    _ = logger.experiment
+    names = [f"metric_{i}" for i in range(n_metrics)]
+    start = time.perf_counter()
+    for step in range(steps):
+        logger.log_metrics({name: step / (i + 1) for i, name in enumerate(names)}, step=step)
+    duration = time.perf_counter() - start
+    start = time.perf_counter()
+    logger.finalize("success")
+    finalize_duration = time.perf_counter() - start
+    return {
+        "calls_per_second": steps / duration,
+        "metrics_per_second": steps * n_metrics / duration,
+        "finalize_seconds": finalize_duration
+    }
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as root:
+        use_local_stores(root)
+        results = {mode: run(mode, root, args.steps, args.metrics) for mode in args.modes}
+    write_report(args.output, "logger_throughput", vars(args), results)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
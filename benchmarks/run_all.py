@@ -0,0 +1,52 @@
+"""Run all benchmarks with default parameters and merge reports into a single JSON file.
+
+Usage:
+    python benchmarks/run_all.py [--output results.json] [--skip logger_throughput]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import BENCHMARKS_ROOT, get_environment
+
+
+BENCHMARKS = ["import_time", "agent_overhead", "logger_throughput", "sweepdb_latency", "export_throughput"]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Run all benchmarks")
+    parser.add_argument("--skip", nargs="+", choices=BENCHMARKS, default=[], help="Benchmarks to skip")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def main(args):
+    results = {"environment": get_environment(), "benchmarks": {}}
+    with tempfile.TemporaryDirectory() as root:
+        for name in BENCHMARKS:
+            if name in args.skip:
+                continue
+            print(f"Run {name}", file=sys.stderr)
+            path = os.path.join(root, name + ".json")
+            result = subprocess.run([sys.executable, os.path.join(BENCHMARKS_ROOT, name + ".py"), "--output", path])
+            report = {"returncode": result.returncode}
+            if os.path.exists(path):
+                with open(path) as fp:
+                    report.update(json.load(fp))
+            results["benchmarks"][name] = report
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as fp:
+            fp.write(text + "\n")
+    if any(report["returncode"] != 0 for report in results["benchmarks"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
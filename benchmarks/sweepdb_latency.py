@@ -0,0 +1,66 @@
+"""Measure latency of SweepDB queries on a SQLite database with many sweeps.
+
+Usage:
+    python benchmarks/sweepdb_latency.py [--sweeps 1000] [--repeats 100] [--output result.json]
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from common import measure, summarize, use_local_stores, write_report
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser("Measure SweepDB query latency")
+    parser.add_argument("--sweeps", type=int, default=1000, help="The number of sweeps in the database")
+    parser.add_argument("--projects", type=int, default=10, help="The number of projects")
+    parser.add_argument("--repeats", type=int, default=100, help="The number of measurements for each query")
+    parser.add_argument("--output", help="Path to the JSON report")
+    return parser.parse_args()
+
+
+def make_config(project, name):
+    return {
+        "project": project,
+        "name": name,
+        "run_cap": 100,
+        "method": "bayes",
+        "metric": {"name": "loss", "goal": "minimize"},
+        "parameters": {f"param_{i}": {"min": 0.0, "max": 1.0} for i in range(20)},
+        "command": ["${env}", "python", "train.py", "${args_no_hyphens}"],
+        "_parent_mlflow_run_id_": "0" * 32
+    }
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as root:
+        use_local_stores(root)
+        from venik.utils import SweepDB
+
+        db = SweepDB()
+        projects = [f"project-{i}" for i in range(args.projects)]
+        sweep_ids = [f"{projects[i % len(projects)]}-sweep-{i}" for i in range(args.sweeps)]
+        durations = []
+        for i, sweep_id in enumerate(sweep_ids):
+            start = time.perf_counter()
+            db.add_sweep(sweep_id, make_config(projects[i % len(projects)], f"sweep-{i}"))
+            durations.append(time.perf_counter() - start)
+        results = {"add_sweep": summarize(durations)}
+
+        rng = random.Random(0)
+        results["get_sweeps_list"] = measure(db.get_sweeps_list, max(args.repeats // 10, 1))
+        results["get_sweeps_list_project"] = measure(lambda: db.get_sweeps_list(rng.choice(projects)), args.repeats)
+        results["has_sweep"] = measure(lambda: db.has_sweep(rng.choice(sweep_ids)), args.repeats)
+        results["get_sweep_config"] = measure(lambda: db.get_sweep_config(rng.choice(sweep_ids)), args.repeats)
+        results["set_sweep_status"] = measure(lambda: db.set_sweep_status(rng.choice(sweep_ids), "active"),
+                                              args.repeats)
+        results["claim_trials"] = measure(lambda: db.claim_trials(rng.choice(sweep_ids), max_trials=args.repeats),
+                                          args.repeats)
+        results["add_cpu_time"] = measure(lambda: db.add_cpu_time(rng.choice(sweep_ids), 1.0), args.repeats)
+    write_report(args.output, "sweepdb_latency", vars(args), results)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
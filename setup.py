@@ -19,6 +19,9 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     python_requires=">=3.9",
+    entry_points={
+        "console_scripts": ["venik=venik.cli:main"]
+    },
     install_requires=[
         "mlflow",
         "optuna",
@@ -0,0 +1,86 @@
+import argparse
+import contextlib
+import os
+import sys
+
+import pytest
+import yaml
+
+from venik import tracking, utils
+
+
+# Trial command, which reports the "x" argument as the loss.
+TRAIN_SCRIPT = """
+import json, os, sys
+args = dict(arg.split("=", 1) for arg in sys.argv[1:])
+with open(os.environ["MLFLOW_INFO_FILE"], "w") as fp:
+    json.dump({"run_id": os.environ["TEST_RUN_ID"], "metrics": {"loss": float(args["x"])}}, fp)
+"""
+
+
+def reset_stores():
+    """Drop cached storages, engines and clients."""
+    utils.get_optuna_storage.cache_clear()
+    utils.get_engine.cache_clear()
+    utils.SweepDB._initialized_engines.clear()
+    tracking.get_client.cache_clear()
+
+
+@pytest.fixture(params=["sqlite", "journal"])
+def stores(request, tmp_path, monkeypatch):
+    """Local MLflow store and Optuna storage of the given type."""
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", f"sqlite:///{tmp_path}/mlflow.db")
+    if request.param == "journal":
+        monkeypatch.setenv("OPTUNA_STORAGE", f"journal://{tmp_path}/optuna.log")
+    else:
+        monkeypatch.setenv("OPTUNA_STORAGE", f"sqlite:///{tmp_path}/optuna.db")
+    reset_stores()
+    yield request.param
+    reset_stores()
+
+
+@pytest.fixture
+def sqlite_stores(tmp_path, monkeypatch):
+    """Local MLflow store and SQLite Optuna storage."""
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", f"sqlite:///{tmp_path}/mlflow.db")
+    monkeypatch.setenv("OPTUNA_STORAGE", f"sqlite:///{tmp_path}/optuna.db")
+    reset_stores()
+    yield
+    reset_stores()
+
+
+@pytest.fixture
+def make_sweep(tmp_path, monkeypatch):
+    """Get the function, which creates a sweep with the TRAIN_SCRIPT command and returns the sweep ID.
+
+    Trials report metrics to a single precreated MLflow run.
+    """
+    from mlflow.tracking import MlflowClient
+    from venik.sweep import init_sweep
+
+    client = MlflowClient(os.environ["MLFLOW_TRACKING_URI"])
+    run = client.create_run(client.create_experiment("trials"))
+    monkeypatch.setenv("TEST_RUN_ID", run.info.run_id)
+    counter = [0]
+
+    def make(**config):
+        counter[0] += 1
+        sweep_config = {
+            "project": "test",
+            "name": f"sweep{counter[0]}",
+            "run_cap": 4,
+            "method": "random",
+            "metric": {"name": "loss", "goal": "minimize"},
+            "parameters": {"x": {"min": 0.0, "max": 1.0}},
+            "command": ["${env}", sys.executable, "-c", TRAIN_SCRIPT, "${args_no_hyphens}"]
+        }
+        sweep_config.update(config)
+        path = os.path.join(tmp_path, f"sweep{counter[0]}.yaml")
+        with open(path, "w") as fp:
+            yaml.safe_dump(sweep_config, fp)
+        with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+            init_sweep(argparse.Namespace(config=path))
+        sweeps = utils.get_sweep_db().get_sweeps_list(project="test")
+        return [sweep["sweep_id"] for sweep in sweeps if sweep["name"] == sweep_config["name"]][-1]
+
+    return make
@@ -0,0 +1,108 @@
+import os
+import subprocess as sp
+import sys
+
+import optuna
+import pytest
+from optuna.trial import TrialState
+
+from venik.agent import DEDUP_SOURCE_ATTR, WorkerClient, main, parse_arguments, terminate, wait_process
+from venik.utils import get_optuna_storage, get_sweep_db
+
+
+def load_trials(sweep_id):
+    return optuna.load_study(study_name=sweep_id, storage=get_optuna_storage()).get_trials()
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_agent(stores, make_sweep, batch_size):
+    sweep_id = make_sweep()
+    main(parse_arguments([sweep_id, "--count", "3", "--batch-size", str(batch_size)]))
+    trials = load_trials(sweep_id)
+    assert len(trials) == 3
+    for trial in trials:
+        assert trial.state == TrialState.COMPLETE
+        assert trial.value == pytest.approx(trial.params["x"])
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_agent_budget(stores, make_sweep, batch_size):
+    sweep_id = make_sweep(budget={"max_trials": 3})
+    main(parse_arguments([sweep_id, "--count", "2", "--batch-size", str(batch_size)]))
+    assert get_sweep_db().get_sweep_status(sweep_id) == "active"
+    main(parse_arguments([sweep_id, "--count", "2", "--batch-size", str(batch_size)]))
+    trials = load_trials(sweep_id)
+    assert len([trial for trial in trials if trial.state == TrialState.COMPLETE]) == 3
+    assert get_sweep_db().get_budget_usage(sweep_id)["trials_started"] == 3
+    assert get_sweep_db().get_sweep_status(sweep_id) == "exhausted"
+
+
+def test_agent_dedup(stores, make_sweep):
+    parameters = {"x": {"values": [0.5]}}
+    sweep_id = make_sweep(parameters=parameters, dedup=True)
+    main(parse_arguments([sweep_id, "--count", "3"]))
+    trials = load_trials(sweep_id)
+    assert [trial.state for trial in trials] == [TrialState.COMPLETE] * 3
+    assert [DEDUP_SOURCE_ATTR in trial.user_attrs for trial in trials] == [False, True, True]
+    assert all(trial.value == 0.5 for trial in trials)
+    # Trials of other sweeps are reused too, but trials of the sweep are preferred.
+    other_id = make_sweep(parameters=parameters, dedup={"sweeps": [sweep_id]})
+    main(parse_arguments([other_id, "--count", "2"]))
+    trials = load_trials(other_id)
+    assert [trial.user_attrs.get(DEDUP_SOURCE_ATTR) for trial in trials] == [f"{sweep_id}:0", f"{other_id}:0"]
+
+
+# Training function for the persistent worker.
+WORKER_MODULE = """
+import os, time
+
+def main(args):
+    if args["mode"] == "fail":
+        raise RuntimeError("Trial failed")
+    end = time.process_time() + 0.2
+    while time.process_time() < end:
+        pass
+    with open(args["path"], "w") as fp:
+        fp.write(os.environ["TRIAL_VALUE"])
+"""
+
+
+def test_worker_protocol(tmp_path, monkeypatch):
+    (tmp_path / "train.py").write_text(WORKER_MODULE)
+    monkeypatch.chdir(tmp_path)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    worker = WorkerClient([sys.executable, "-m", "venik.worker", "train:main"], env)
+    try:
+        for i in range(2):
+            path = str(tmp_path / f"out{i}")
+            worker.submit({"mode": "ok", "path": path}, {"TRIAL_VALUE": str(i)})
+            assert worker.wait(timeout=30) == 0
+            assert worker.alive
+            with open(path) as fp:
+                assert fp.read() == str(i)
+            assert worker.rusage["resource/user_cpu"] + worker.rusage["resource/system_cpu"] >= 0.15
+        worker.submit({"mode": "fail"}, {})
+        assert worker.wait(timeout=30) == 1
+        assert worker.alive
+    finally:
+        worker.close()
+    assert not worker.alive
+
+
+def test_wait_process_rusage():
+    process = sp.Popen([sys.executable, "-c", "import time\nend = time.process_time() + 0.3\n"
+                        "while time.process_time() < end: pass"])
+    assert wait_process(process) == 0
+    assert process.rusage["resource/user_cpu"] + process.rusage["resource/system_cpu"] >= 0.25
+    assert process.rusage["resource/max_rss_mb"] > 0
+    # The exit code is kept after the process is reaped.
+    assert wait_process(process) == 0
+
+
+def test_wait_process_timeout():
+    process = sp.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    with pytest.raises(sp.TimeoutExpired):
+        wait_process(process, timeout=0.1)
+    terminate(process)
+    assert process.returncode == -15
+    assert process.rusage is not None
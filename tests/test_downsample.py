@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from venik.downsample import HISTORY_DTYPE, BucketDownsampler, EveryDownsampler, LTTBDownsampler, \
+    RawHistoryWriter, lttb, make_downsampler_factory, to_history_array
+
+
+def make_history(length=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    history = np.empty(length, dtype=HISTORY_DTYPE)
+    history["step"] = np.arange(length)
+    history["timestamp"] = 1000 * np.arange(length) // 7
+    history["value"] = rng.normal(size=length).cumsum()
+    return history
+
+
+def stream(downsampler, history, page_size=77):
+    for i in range(0, len(history), page_size):
+        downsampler.update(history[i:i + page_size])
+    return downsampler.result()
+
+
+def test_every():
+    history = make_history()
+    assert np.array_equal(stream(EveryDownsampler(10), history), history[::10])
+    assert np.array_equal(stream(EveryDownsampler(1), history), history)
+
+
+@pytest.mark.parametrize("seconds", [0.5, 3, 1000])
+def test_bucket_mean(seconds):
+    history = make_history()
+    result = stream(BucketDownsampler(seconds, mode="mean"), history)
+    buckets = history["timestamp"] // int(seconds * 1000)
+    assert len(result) == len(np.unique(buckets))
+    for point, bucket in zip(result, np.unique(buckets)):
+        selected = history[buckets == bucket]
+        assert point["timestamp"] == bucket * int(seconds * 1000)
+        assert point["step"] == selected["step"].max()
+        assert point["value"] == pytest.approx(selected["value"].mean())
+
+
+@pytest.mark.parametrize("seconds", [0.5, 3, 1000])
+def test_bucket_minmax(seconds):
+    history = make_history()
+    result = stream(BucketDownsampler(seconds, mode="minmax"), history)
+    buckets = history["timestamp"] // int(seconds * 1000)
+    expected = set()
+    for bucket in np.unique(buckets):
+        selected = history[buckets == bucket]
+        expected.add(selected[selected["value"].argmin()]["step"])
+        expected.add(selected[selected["value"].argmax()]["step"])
+    assert set(result["step"].tolist()) == expected
+    assert np.all(np.diff(result["step"]) > 0)
+
+
+def test_bucket_unknown_mode():
+    with pytest.raises(ValueError):
+        BucketDownsampler(1, mode="median")
+
+
+def test_lttb_short_history():
+    history = make_history(length=50)
+    # All points are preselected, so the result matches LTTB of the whole history.
+    assert np.array_equal(stream(LTTBDownsampler(20), history, page_size=7), lttb(history, 20))
+    assert np.array_equal(stream(LTTBDownsampler(100), history), history)
+
+
+def test_lttb_long_history():
+    history = make_history(length=100000)
+    downsampler = LTTBDownsampler(100)
+    result = stream(downsampler, history, page_size=1000)
+    assert len(result) == 100
+    assert result[0] == history[0]
+    assert result[-1] == history[-1]
+    assert np.all(np.diff(result["step"]) > 0)
+    # Memory is bounded by the number of preselected buckets.
+    assert len(downsampler._mins) <= downsampler.max_buckets
+    assert len(downsampler._tail) < downsampler.bucket_size
+    # Global extremes are preselected.
+    assert history["value"].argmin() in result["step"] or history["value"].argmax() in result["step"]
+
+
+def test_lttb():
+    history = make_history(length=100)
+    result = lttb(history, 10)
+    assert len(result) == 10
+    assert result[0] == history[0]
+    assert result[-1] == history[-1]
+    assert len(lttb(history, 2)) == 2
+
+
+def test_factory():
+    assert isinstance(make_downsampler_factory("every:5")(), EveryDownsampler)
+    downsampler = make_downsampler_factory("minmax:2.5")()
+    assert downsampler.mode == "minmax"
+    assert downsampler.width == 2500
+    assert make_downsampler_factory("lttb:10")().n == 10
+    for spec in ["median:1", "every:x", "every:0", "lttb:-1", "every"]:
+        with pytest.raises(ValueError):
+            make_downsampler_factory(spec)
+
+
+def test_raw_history_writer(tmp_path):
+    history = make_history()
+    path = str(tmp_path / "history.npy")
+    writer = RawHistoryWriter(path)
+    for i in range(0, len(history), 300):
+        writer.write(history[i:i + 300])
+    writer.close()
+    loaded = np.load(path, mmap_mode="r")
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, history)
+    # An empty history is a valid array too.
+    writer = RawHistoryWriter(path)
+    writer.close()
+    assert len(np.load(path)) == 0
+
+
+def test_to_history_array():
+    result = to_history_array([(2, 10, 1.0), (1, 20, 2.0), (1, 5, 3.0)])
+    assert result.tolist() == [(1, 5, 3.0), (1, 20, 2.0), (2, 10, 1.0)]
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+from types import SimpleNamespace
+
+import yaml
+
+from venik.gather import ParquetWriter, SqliteWriter, YamlWriter
+
+
+EXPERIMENT = SimpleNamespace(name="experiment")
+
+
+def make_run(run_id, params, metrics):
+    info = SimpleNamespace(run_id=run_id, run_name=run_id, experiment_id="1", status="FINISHED", user_id="user",
+                           start_time=1000, end_time=2000)
+    return SimpleNamespace(info=info, data=SimpleNamespace(params=params, metrics=metrics))
+
+
+def read_values(path, table):
+    with sqlite3.connect(path) as conn:
+        return sorted(conn.execute(f"SELECT run_id, key, value FROM {table}"))
+
+
+def test_sqlite_writer_many_keys(tmp_path):
+    writer = SqliteWriter(str(tmp_path), chunk_size=2)
+    written = []
+    for i in range(5):
+        written.extend(writer.write(EXPERIMENT, make_run(f"run-{i}", {f"param{i}": "a"},
+                                                         {f"metric{i}.{j}": float(j) for j in range(1000)})))
+    written.extend(writer.close())
+    assert len(written) == 5
+    path = os.path.join(tmp_path, "runs.sqlite")
+    assert len(read_values(path, "metrics")) == 5000
+    assert read_values(path, "params")[0] == ("run-0", "param0", "a")
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT run_name, status FROM runs WHERE run_id = 'run-3'").fetchall() == [
+            ("run-3", "FINISHED")]
+
+
+def test_sqlite_writer_replace(tmp_path):
+    writer = SqliteWriter(str(tmp_path))
+    assert writer.is_new
+    writer.write(EXPERIMENT, make_run("run", {"a": "1", "b": "2"}, {"loss": 1.0, "acc": 0.5}))
+    writer.close()
+    writer = SqliteWriter(str(tmp_path))
+    assert not writer.is_new
+    writer.write(EXPERIMENT, make_run("run", {"a": "3"}, {"loss": 0.5}))
+    writer.close()
+    path = os.path.join(tmp_path, "runs.sqlite")
+    assert read_values(path, "params") == [("run", "a", "3")]
+    assert read_values(path, "metrics") == [("run", "loss", 0.5)]
+
+
+def test_sqlite_writer_legacy_table(tmp_path):
+    with sqlite3.connect(os.path.join(tmp_path, "runs.sqlite")) as conn:
+        conn.execute('CREATE TABLE runs (run_id TEXT PRIMARY KEY, run_name TEXT, "metrics.loss" REAL)')
+        conn.execute("INSERT INTO runs VALUES ('old', 'old', 1.0)")
+    writer = SqliteWriter(str(tmp_path))
+    # The manifest is ignored and all runs are exported again.
+    assert writer.is_new
+    writer.write(EXPERIMENT, make_run("run", {}, {"loss": 1.0}))
+    writer.close()
+    with sqlite3.connect(os.path.join(tmp_path, "runs.sqlite")) as conn:
+        assert conn.execute("SELECT run_id FROM runs").fetchall() == [("run",)]
+
+
+def test_yaml_writer(tmp_path):
+    writer = YamlWriter(str(tmp_path))
+    [(run, run_dir, paths)] = writer.write(EXPERIMENT, make_run("run", {"a": "1"}, {"loss": 0.5}))
+    assert run_dir == os.path.join(tmp_path, "experiment", "run")
+    contents = {}
+    for path in paths:
+        with open(path) as fp:
+            contents[os.path.basename(path)] = yaml.safe_load(fp)
+    assert {"a": "1"} in contents.values()
+    assert {"loss": 0.5} in contents.values()
+
+
+def test_parquet_writer(tmp_path):
+    import pyarrow.parquet as pq
+
+    writer = ParquetWriter(str(tmp_path), chunk_size=2)
+    for i in range(3):
+        writer.write(EXPERIMENT, make_run(f"run-{i}", {"a": str(i)}, {"loss": float(i)}))
+    writer.close()
+    path = os.path.join(tmp_path, "runs.parquet")
+    table = pq.read_table(path)
+    assert table.column("run_id").to_pylist() == ["run-0", "run-1", "run-2"]
+    assert table.column("metrics").to_pylist()[2] == [("loss", 2.0)]
+    # An aborted export keeps the previous file.
+    writer = ParquetWriter(str(tmp_path), chunk_size=2)
+    for i in range(3):
+        writer.write(EXPERIMENT, make_run(f"new-{i}", {}, {}))
+    assert writer.abort() == []
+    assert pq.read_table(path).column("run_id").to_pylist() == ["run-0", "run-1", "run-2"]
+    assert not os.path.exists(path + ".tmp")
@@ -0,0 +1,126 @@
+import os
+import time
+
+import pytest
+
+from venik import gather, plot
+from venik.manifest import Manifest, get_scope
+
+
+class Info:
+    def __init__(self, run_id, status="FINISHED", start_time=1000, experiment_id="1"):
+        self.run_id = run_id
+        self.experiment_id = experiment_id
+        self.status = status
+        self.start_time = start_time
+        self.end_time = start_time + 1
+
+
+class Data:
+    _metric_objs = []
+
+
+class Run:
+    def __init__(self, *args, **kwargs):
+        self.info = Info(*args, **kwargs)
+        self.data = Data()
+
+
+def write_file(root, name):
+    path = os.path.join(root, name)
+    with open(path, "w") as fp:
+        fp.write(name)
+    return path
+
+
+def test_manifest_round_trip(tmp_path):
+    scope = get_scope(pattern="run-")
+    with Manifest(tmp_path, "gather") as manifest:
+        manifest.update(Run("a"), [write_file(tmp_path, "a.yaml")], format="yaml")
+        manifest.update(Run("b", status="RUNNING", start_time=5000), [write_file(tmp_path, "b.yaml")], format="yaml")
+        manifest.update(Run("b", start_time=5000), [write_file(tmp_path, "b.yaml")], format="yaml")
+        manifest.update_listed("1", scope, 5000)
+    with Manifest(tmp_path, "gather") as manifest:
+        assert set(manifest.records) == {"a", "b"}
+        assert manifest.is_unchanged(Run("a"), format="yaml")
+        assert not manifest.is_unchanged(Run("a"), format="sqlite")
+        assert not manifest.is_unchanged(Run("a", status="FAILED"), format="yaml")
+        assert manifest.is_unchanged(Run("b", start_time=5000), format="yaml")
+        filters = manifest.get_filters("1", scope, "name_filter")
+        assert all(f.startswith("name_filter and ") for f in filters)
+        assert manifest.get_filters("2", scope, "name_filter") == ["name_filter"]
+        assert manifest.get_filters("1", get_scope(pattern="other"), "") == [""]
+    # Outdated records are removed on close.
+    with open(os.path.join(tmp_path, ".venik-gather.jsonl")) as fp:
+        assert len(fp.readlines()) == 3
+    # Other commands use separate manifests.
+    with Manifest(tmp_path, "plot") as manifest:
+        assert not manifest.records
+        assert manifest.get_filters("1", scope) == [""]
+
+
+def test_manifest_truncated_line(tmp_path):
+    with Manifest(tmp_path, "gather") as manifest:
+        manifest.update(Run("a"), [write_file(tmp_path, "a.yaml")])
+    with open(os.path.join(tmp_path, ".venik-gather.jsonl"), "a") as fp:
+        fp.write('{"run_id": "b", "experi')
+    with Manifest(tmp_path, "gather") as manifest:
+        assert set(manifest.records) == {"a"}
+
+
+@pytest.fixture
+def runs(tmp_path, monkeypatch):
+    """MLflow store with runs started 2, 4, 6 and 8 hours ago."""
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", f"sqlite:///{tmp_path}/mlflow.db")
+    from mlflow.tracking import MlflowClient
+    client = MlflowClient()
+    experiment_id = client.create_experiment("experiment")
+    now = int(time.time() * 1000)
+    for i in range(4):
+        run = client.create_run(experiment_id, run_name=f"run-{i}", start_time=now - (4 - i) * 7200 * 1000)
+        client.log_metric(run.info.run_id, "loss", float(i))
+        client.set_terminated(run.info.run_id, "FINISHED")
+    return client, experiment_id
+
+
+def get_exported(root):
+    return sorted(name for name in os.listdir(os.path.join(root, "experiment")))
+
+
+def test_incremental_gather_interrupted(tmp_path, runs, monkeypatch):
+    target = str(tmp_path / "out")
+    write = gather.YamlWriter.write
+    calls = []
+
+    def interrupted_write(self, *args):
+        calls.append(None)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return write(self, *args)
+
+    monkeypatch.setattr(gather.YamlWriter, "write", interrupted_write)
+    with pytest.raises(KeyboardInterrupt):
+        gather.main(gather.parse_arguments(["run-", target, "--incremental"]))
+    monkeypatch.setattr(gather.YamlWriter, "write", write)
+    gather.main(gather.parse_arguments(["run-", target, "--incremental"]))
+    assert get_exported(target) == ["run-0", "run-1", "run-2", "run-3"]
+
+
+def test_incremental_commands_and_patterns(tmp_path, runs):
+    client, experiment_id = runs
+    target = str(tmp_path / "out")
+    gather.main(gather.parse_arguments(["run-[23]", target, "--incremental"]))
+    assert get_exported(target) == ["run-2", "run-3"]
+    # Another pattern lists runs, which are older than the mark of the previous pattern.
+    gather.main(gather.parse_arguments(["run-", target, "--incremental"]))
+    assert get_exported(target) == ["run-0", "run-1", "run-2", "run-3"]
+    # Plot doesn't use records of gather.
+    plot.main(plot.parse_arguments(["run-", "loss", target, "--incremental"]))
+    for i in range(4):
+        run_dir = os.path.join(target, "experiment", f"run-{i}")
+        assert any(os.path.isfile(os.path.join(run_dir, name, "meta.json")) for name in os.listdir(run_dir))
+    # New runs are exported by the next incremental call.
+    run = client.create_run(experiment_id, run_name="run-4")
+    client.set_terminated(run.info.run_id, "FINISHED")
+    gather.main(gather.parse_arguments(["run-", target, "--incremental"]))
+    assert "run-4" in get_exported(target)
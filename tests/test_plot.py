@@ -0,0 +1,77 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from venik import plot
+
+
+HISTORY_LENGTH = 1000
+
+
+@pytest.fixture
+def history(sqlite_stores):
+    """Create a run with a long loss history."""
+    from mlflow.entities import Metric
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient(os.environ["MLFLOW_TRACKING_URI"])
+    run = client.create_run(client.create_experiment("experiment"), run_name="run")
+    metrics = [Metric("loss", float(step), 1000 + step, step) for step in range(HISTORY_LENGTH)]
+    for i in range(0, len(metrics), 500):
+        client.log_batch(run.info.run_id, metrics=metrics[i:i + 500])
+    client.set_terminated(run.info.run_id, "FINISHED")
+    return client, run.info.run_id
+
+
+def load(target, run_id):
+    history = np.load(os.path.join(target, "experiment", "run", run_id, "loss.npy"), mmap_mode="r")
+    return history["step"], history["value"]
+
+
+@pytest.mark.parametrize("downsample", [None, "every:10", "lttb:20", "points:20"])
+def test_plot_downsample(tmp_path, history, downsample):
+    client, run_id = history
+    target = str(tmp_path / "out")
+    argv = ["run", "loss", target] + (["--downsample", downsample] if downsample else [])
+    plot.main(plot.parse_arguments(argv))
+    steps, values = load(target, run_id)
+    assert np.all(np.diff(steps) > 0)
+    assert np.array_equal(steps.astype(float), values)
+    if downsample is None:
+        assert len(steps) == HISTORY_LENGTH
+    elif downsample == "every:10":
+        assert np.array_equal(steps, np.arange(0, HISTORY_LENGTH, 10))
+    else:
+        assert len(steps) == 20
+        assert steps[0] == 0
+        assert steps[-1] == HISTORY_LENGTH - 1
+
+
+def test_plot_points_errors(tmp_path, history):
+    target = str(tmp_path / "out")
+    with pytest.raises(ValueError):
+        plot.main(plot.parse_arguments(["run", "loss", target, "--downsample", "points:0"]))
+    with pytest.raises(ValueError):
+        plot.main(plot.parse_arguments(["run", "loss", target, "--downsample", "points:20", "--raw"]))
+
+
+@pytest.mark.parametrize("output_format", ["arrays", "npz", "parquet", "npy"])
+def test_plot_formats(tmp_path, history, output_format):
+    client, run_id = history
+    target = str(tmp_path / "out")
+    plot.main(plot.parse_arguments(["run", "loss", target, "--format", output_format]))
+    path = os.path.join(target, "experiment", "run", run_id + plot.SAVERS[output_format][1])
+    if output_format == "arrays":
+        values = np.load(os.path.join(path, "loss.npy"), mmap_mode="r")["value"]
+        with open(os.path.join(path, "meta.json")) as fp:
+            assert "start_time" in json.load(fp)
+    elif output_format == "npz":
+        values = np.load(path)["loss/value"]
+    elif output_format == "parquet":
+        import pyarrow.parquet as pq
+        values = pq.read_table(path).column("value").to_numpy()
+    else:
+        values = np.load(path, allow_pickle=True).item()["loss"]
+    assert np.array_equal(values, np.arange(HISTORY_LENGTH, dtype=float))
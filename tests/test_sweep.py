@@ -0,0 +1,26 @@
+import optuna
+import pytest
+
+from venik.agent import main, parse_arguments
+from venik.utils import get_optuna_storage
+
+
+def test_warm_start(stores, make_sweep):
+    source = make_sweep()
+    main(parse_arguments([source, "--count", "2"]))
+    sweep_id = make_sweep(warm_start=[source])
+    study = optuna.load_study(study_name=sweep_id, storage=get_optuna_storage())
+    trials = study.get_trials()
+    assert len(trials) == 2
+    assert all(trial.user_attrs["warm_start_sweep_id"] == source for trial in trials)
+
+
+@pytest.mark.parametrize("metric", [
+    {"name": "loss", "goal": "maximize"},
+    {"name": "accuracy", "goal": "minimize"},
+    [{"name": "loss", "goal": "minimize"}, {"name": "latency", "goal": "minimize"}]
+])
+def test_warm_start_metric_mismatch(stores, make_sweep, metric):
+    source = make_sweep()
+    with pytest.raises(ValueError, match="Can't warm-start"):
+        make_sweep(warm_start=[source], metric=metric)
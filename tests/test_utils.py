@@ -0,0 +1,210 @@
+import json
+import threading
+
+import optuna
+import pytest
+import sqlalchemy as sa
+from optuna.trial import TrialState
+
+from venik.utils import SWEEPS_SCHEMA_VERSION, SWEEPS_TABLE, JournalSweepDB, ParameterSampler, SweepDB, make_sampler
+
+
+def make_engine(tmp_path):
+    return sa.create_engine(f"sqlite:///{tmp_path}/sweeps.db")
+
+
+def create_legacy_sweeps(conn, table, sweep_ids):
+    conn.execute(sa.text(f"CREATE TABLE {table} (sweep_id VARCHAR(255), config TEXT)"))
+    for sweep_id in sweep_ids:
+        conn.execute(sa.text(f"INSERT INTO {table} VALUES (:sweep_id, :config)"),
+                     {"sweep_id": sweep_id, "config": json.dumps({"project": "test", "name": sweep_id})})
+
+
+def get_tables(engine):
+    return set(sa.inspect(engine).get_table_names())
+
+
+def test_migrate_legacy_sweeps(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.begin() as conn:
+        create_legacy_sweeps(conn, "Sweeps", ["a", "b", "a"])
+    db = SweepDB(engine)
+    assert [row["sweep_id"] for row in db.get_sweeps_list(project="test")] == ["a", "b"]
+    assert db.get_sweep_status("a") == "active"
+    assert db.get_budget_usage("a") == {"trials_started": 0, "cpu_seconds": 0}
+    assert get_tables(engine) == {"Sweeps", "SweepsVersion"}
+    with engine.begin() as conn:
+        assert conn.execute(sa.text("SELECT version FROM SweepsVersion")).scalar_one() == SWEEPS_SCHEMA_VERSION
+
+
+def test_resume_interrupted_migration(tmp_path):
+    engine = make_engine(tmp_path)
+    with engine.begin() as conn:
+        # The legacy table was renamed and one sweep was copied.
+        create_legacy_sweeps(conn, "SweepsLegacy", ["a", "b"])
+    SWEEPS_TABLE.create(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.text("INSERT INTO Sweeps (sweep_id, project, name, status, config) "
+                             "VALUES ('a', 'test', 'a', 'active', '{}')"))
+    db = SweepDB(engine)
+    assert [row["sweep_id"] for row in db.get_sweeps_list()] == ["a", "b"]
+    assert get_tables(engine) == {"Sweeps", "SweepsVersion"}
+
+
+def test_resume_unversioned_migration(tmp_path):
+    engine = make_engine(tmp_path)
+    SweepDB(engine).add_sweep("a", {"project": "test", "name": "a"})
+    # The migration finished, but the version was not updated.
+    with engine.begin() as conn:
+        conn.execute(sa.text("UPDATE SweepsVersion SET version = 0"))
+    SweepDB._initialized_engines.clear()
+    db = SweepDB(engine)
+    assert [row["sweep_id"] for row in db.get_sweeps_list()] == ["a"]
+    assert get_tables(engine) == {"Sweeps", "SweepsVersion"}
+
+
+def test_concurrent_schema_init(tmp_path):
+    with make_engine(tmp_path).begin() as conn:
+        create_legacy_sweeps(conn, "Sweeps", ["a", "b"])
+    engines = [make_engine(tmp_path) for _ in range(8)]
+    errors = []
+
+    def init(engine):
+        try:
+            SweepDB(engine)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=init, args=(engine,)) for engine in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    db = SweepDB(engines[0])
+    assert [row["sweep_id"] for row in db.get_sweeps_list()] == ["a", "b"]
+    with engines[0].begin() as conn:
+        assert conn.execute(sa.text("SELECT count(*) FROM SweepsVersion")).scalar_one() == 1
+
+
+
+@pytest.fixture(params=["sqlite", "journal"])
+def make_db(request, tmp_path):
+    """Get the function, which opens a new connection to the sweeps database of the given type."""
+    engines = []
+
+    def make():
+        if request.param == "journal":
+            return JournalSweepDB(str(tmp_path / "optuna.log.sweeps.log"))
+        engines.append(make_engine(tmp_path))
+        return SweepDB(engines[-1])
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+def test_journal_sweeps(tmp_path):
+    path = str(tmp_path / "sweeps.log")
+    db = JournalSweepDB(path)
+    db.add_sweep("a", {"project": "test", "name": "a", "x": 1})
+    db.add_sweep("b", {"project": "other", "name": "b"})
+    with pytest.raises(RuntimeError):
+        db.add_sweep("a", {"project": "test", "name": "a"})
+    db.set_sweep_status("b", "exhausted")
+    # Records of other instances are read from the log.
+    other = JournalSweepDB(path)
+    assert other.has_sweep("a")
+    assert other.get_sweep_config("a")["x"] == 1
+    assert [sweep["sweep_id"] for sweep in other.get_sweeps_list(project="test")] == ["a"]
+    assert other.get_sweep_status("b") == "exhausted"
+    other.del_sweep("a")
+    assert not db.has_sweep("a")
+    with pytest.raises(KeyError):
+        db.get_sweep_config("a")
+    # A partially written record is skipped until it is complete.
+    with open(path, "a") as fp:
+        fp.write('{"op": "status", "sweep_id": "b", "status": "act')
+    assert db.get_sweep_status("b") == "exhausted"
+    with open(path, "a") as fp:
+        fp.write('ive"}\n')
+    assert db.get_sweep_status("b") == "active"
+
+
+def test_claim_trials_concurrent(make_db):
+    db = make_db()
+    db.add_sweep("sweep", {"project": "test", "name": "sweep"})
+    claimed = []
+
+    def claim(count):
+        thread_db = make_db()
+        while thread_db.claim_trials("sweep", count, max_trials=50):
+            claimed.append(count)
+
+    threads = [threading.Thread(target=claim, args=(1 + i % 3,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 48 <= sum(claimed) <= 50
+    assert db.get_budget_usage("sweep")["trials_started"] == sum(claimed)
+    # The rest of the budget is claimed by single trials.
+    while db.claim_trials("sweep", 1, max_trials=50):
+        pass
+    assert db.get_budget_usage("sweep")["trials_started"] == 50
+
+
+def test_claim_trials_cpu_time(make_db):
+    db = make_db()
+    db.add_sweep("sweep", {"project": "test", "name": "sweep"})
+    assert db.claim_trials("sweep", 2, max_cpu_seconds=10)
+    db.add_cpu_time("sweep", 6)
+    assert db.claim_trials("sweep", 1, max_cpu_seconds=10)
+    db.add_cpu_time("sweep", 6)
+    assert not db.claim_trials("sweep", 1, max_cpu_seconds=10)
+    assert db.get_budget_usage("sweep") == {"trials_started": 3, "cpu_seconds": 12}
+
+
+PARAMETERS = {
+    "x": {"min": 0.0, "max": 1.0},
+    "n": {"min": 1, "max": 4},
+    "lr": {"min": 1e-4, "max": 1e-1, "distribution": "log_uniform_values"},
+    "c": {"values": ["a", "b"]}
+}
+
+
+@pytest.fixture(params=["memory", "sqlite", "journal"])
+def optuna_storage(request, tmp_path):
+    if request.param == "memory":
+        return optuna.storages.InMemoryStorage()
+    if request.param == "journal":
+        from optuna.storages.journal import JournalFileBackend
+        return optuna.storages.JournalStorage(JournalFileBackend(str(tmp_path / "optuna.log")))
+    return optuna.storages.RDBStorage(f"sqlite:///{tmp_path}/optuna.db")
+
+
+@pytest.mark.parametrize("method", ["random", "bayes"])
+def test_parameter_sampler_ask(optuna_storage, method):
+    config = {"method": method, "parameters": PARAMETERS, "sampler": {"seed": 0}}
+    defaults = {"n_startup_trials": 2, "constant_liar": True} if method == "bayes" else {}
+    sampler = ParameterSampler(PARAMETERS)
+    study = optuna.create_study(storage=optuna_storage, sampler=make_sampler(config, **defaults))
+    study.enqueue_trial({"x": 0.5, "n": 2, "lr": 0.01, "c": "b"})
+    for _ in range(3):
+        trials = sampler.ask(study, batch_size=3)
+        assert len({trial.number for trial in trials}) == 3
+        for trial in trials:
+            params = sampler.sample(trial)
+            assert 0 <= params["x"] <= 1
+            assert params["n"] in [1, 2, 3, 4]
+            assert 1e-4 <= params["lr"] <= 1e-1
+            assert params["c"] in ["a", "b"]
+            study.tell(trial, params["x"])
+    trials = study.get_trials()
+    assert [trial.number for trial in trials] == list(range(9))
+    assert all(trial.state == TrialState.COMPLETE for trial in trials)
+    # The enqueued trial is started first.
+    assert trials[0].params == {"x": 0.5, "n": 2, "lr": 0.01, "c": "b"}
+    # All parameters are saved with the trial.
+    assert all(set(trial.params) == set(PARAMETERS) for trial in trials)
+    assert all(trial.distributions == sampler.distributions for trial in trials)
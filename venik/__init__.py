@@ -1 +1,9 @@
-from .loggers import MLFlowLogger
+__all__ = ["MLFlowLogger"]
+
+
+def __getattr__(name):
+    # The logger depends on PyTorch Lightning, which is slow to import and isn't needed by CLI tools.
+    if name == "MLFlowLogger":
+        from .loggers import MLFlowLogger
+        return MLFlowLogger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,44 +1,506 @@
 import argparse
+import collections
+import hashlib
 import json
-import optuna
 import os
+import queue
+import select
+import signal
+import socket
 import string
 import tempfile
+import threading
+import time
+import warnings
 import gc
-from mlflow.tracking import MlflowClient
 import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor
 
-from .utils import SweepDB, get_optuna_storage, ParameterSampler
+import sqlalchemy as sa
 
+from .spool import SpoolClient
+from .tracking import get_client
+from .utils import get_optuna_storage, get_sweep_db, get_sweep_metrics, make_pruner, make_retry_callback, make_sampler, \
+    enable_heartbeat, ParameterSampler
 
-def parse_arguments():
+
+# Delay between reads of intermediate metric values in seconds.
+REPORT_POLL_INTERVAL = 1.0
+# Time to wait for a process to finish after SIGTERM in seconds.
+TERMINATE_TIMEOUT = 30
+# Trial attributes.
+HASH_ATTR = "venik_hash"
+RUN_ID_ATTR = "mlflow_run_id"
+DEDUP_SOURCE_ATTR = "dedup_source"
+
+
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser("Start sweep")
     parser.add_argument("sweep_id", help="Config path")
     parser.add_argument("--count", type=int, help="The total amount of runs")
     parser.add_argument("-a", "--args", nargs="*", help="Extra parameters for the worker")
-    args = parser.parse_args()
+    parser.add_argument("-p", "--parallel", type=int, default=1, help="The number of trials to run simultaneously")
+    parser.add_argument("--slot-cpus", nargs="*", help="CPU list for each parallel slot (like 0-3 4-7)")
+    parser.add_argument("--slot-env", nargs="*", help="Per-slot environment variables in the form NAME=VALUE1,VALUE2,...")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Sample parameters for this number of trials at once and report results in background")
+    args = parser.parse_args(argv)
     return args
 
 
+class TrialError(RuntimeError):
+    """Failure of a single trial, which doesn't stop the agent."""
+    pass
+
+
+def make_slots(parallel, cpus=None, env=None):
+    """Build settings for each parallel slot.
+
+    Args:
+        parallel: The number of slots.
+        cpus: Optional list of CPU lists (one per slot) passed to taskset.
+        env: Optional list of NAME=VALUE1,VALUE2,... specifications (one value per slot).
+    """
+    if parallel < 1:
+        raise ValueError(f"Need a positive number of slots, got {parallel}")
+    slots = [{"cpus": None, "env": {}} for _ in range(parallel)]
+    if cpus:
+        if len(cpus) != parallel:
+            raise ValueError(f"Need {parallel} CPU lists, got {len(cpus)}")
+        for slot, cpu_list in zip(slots, cpus):
+            slot["cpus"] = cpu_list
+    for spec in env or []:
+        if "=" not in spec:
+            raise ValueError(f"Wrong slot environment specification: {spec}")
+        name, values = spec.split("=", 1)
+        values = values.split(",")
+        if len(values) != parallel:
+            raise ValueError(f"Need {parallel} values for {name}, got {len(values)}")
+        for slot, value in zip(slots, values):
+            slot["env"][name] = value
+    return slots
+
+
+def terminate(process):
+    """Stop the process with SIGTERM or with SIGKILL after timeout."""
+    # The process is reaped only with wait4, so resource usage of stopped processes is always collected.
+    try:
+        wait_process(process, timeout=0)
+        return
+    except sp.TimeoutExpired:
+        pass
+    # Popen.terminate would reap the exited process with poll. The PID isn't reused until the process is waited.
+    os.kill(process.pid, signal.SIGTERM)
+    try:
+        wait_process(process, timeout=TERMINATE_TIMEOUT)
+    except sp.TimeoutExpired:
+        os.kill(process.pid, signal.SIGKILL)
+        wait_process(process)
+
+
+def get_trial_hash(args, cmd):
+    """Get a hash of sampled arguments and the command."""
+    data = json.dumps({"args": args, "command": cmd}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def get_rusage_metrics(rusage):
+    """Convert resource usage into metrics."""
+    return {
+        "resource/user_cpu": rusage.ru_utime,
+        "resource/system_cpu": rusage.ru_stime,
+        # Linux reports maximum RSS in kilobytes.
+        "resource/max_rss_mb": rusage.ru_maxrss / 1024
+    }
+
+
+def wait_process(process, timeout=None):
+    """Wait for the process like Popen.wait and save resource usage of the child to process.rusage."""
+    if process.returncode is not None:
+        return process.returncode
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        try:
+            pid, status, rusage = os.wait4(process.pid, 0 if timeout is None else os.WNOHANG)
+        except ChildProcessError:
+            # The process was waited elsewhere.
+            return process.wait()
+        if pid != 0:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            process.rusage = get_rusage_metrics(rusage)
+            return process.returncode
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise sp.TimeoutExpired(process.args, timeout)
+        delay = min(delay * 2, remaining, 0.05)
+        time.sleep(delay)
+
+
+class WorkerClient:
+    """Connection to a persistent worker process (see venik.worker).
+
+    The interface is similar to Popen: submit a trial, wait for it and check returncode.
+    """
+    def __init__(self, cmd, env):
+        self.process = sp.Popen(cmd, env=env, stdin=sp.PIPE, stdout=sp.PIPE, text=True)
+        self.returncode = None
+        self.rusage = None
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def submit(self, args, env):
+        self.returncode = None
+        self.rusage = None
+        self.process.stdin.write(json.dumps({"args": args, "env": env}) + "\n")
+        self.process.stdin.flush()
+
+    def wait(self, timeout=None):
+        if self.returncode is not None:
+            return self.returncode
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise sp.TimeoutExpired(self.process.args, timeout)
+        line = self.process.stdout.readline()
+        if line:
+            response = json.loads(line)
+            self.returncode = 0 if response["status"] == "ok" else 1
+            self.rusage = response.get("rusage", None)
+        else:
+            # The worker exited.
+            self.returncode = self.process.wait() or 1
+        return self.returncode
+
+    def close(self):
+        """Stop the worker after the current trial."""
+        self.process.stdin.close()
+        try:
+            self.process.wait(timeout=TERMINATE_TIMEOUT)
+        except sp.TimeoutExpired:
+            terminate(self.process)
+
+
+class DedupIndex:
+    """Mapping from trial hash to a completed trial of the study, which is updated incrementally.
+
+    Each update reads only new trials by number and rechecks trials, which were unfinished, so the cost
+    doesn't depend on the number of finished trials.
+    """
+    def __init__(self, storage, sweep_id):
+        self.storage = storage
+        self.sweep_id = sweep_id
+        self.study_id = storage.get_study_id_from_name(sweep_id)
+        # Hash -> the first completed trial.
+        self.trials = {}
+        # IDs of trials, which reused results of other trials.
+        self.reused = set()
+        self._n_trials = 0
+        self._unfinished = set()
+        self._lock = threading.Lock()
+
+    def update(self):
+        with self._lock:
+            trial_ids = list(self._unfinished)
+            while True:
+                try:
+                    trial_ids.append(self.storage.get_trial_id_from_study_id_trial_number(self.study_id,
+                                                                                         self._n_trials))
+                except KeyError:
+                    break
+                self._n_trials += 1
+            for trial_id in trial_ids:
+                self._add(self.storage.get_trial(trial_id))
+
+    def _add(self, trial):
+        from optuna.trial import TrialState
+
+        if DEDUP_SOURCE_ATTR in trial.user_attrs:
+            self.reused.add(trial._trial_id)
+        if not trial.state.is_finished():
+            self._unfinished.add(trial._trial_id)
+            return
+        self._unfinished.discard(trial._trial_id)
+        key = trial.user_attrs.get(HASH_ATTR)
+        if (trial.state == TrialState.COMPLETE) and (key is not None):
+            self.trials.setdefault(key, trial)
+
+
 class Agent:
-    def __init__(self, sweep_id, sweep_config, cmd_args=None):
+    def __init__(self, sweep_id, sweep_config, cmd_args=None, slots=None):
         self.sweep_id = sweep_id
         self.config = sweep_config
         assert "run_cap" in self.config
         self.sampler = ParameterSampler(self.config["parameters"])
+        # Intermediate values are reported only if there is a pruner.
+        self.pruning = self.config.get("pruner") is not None
+        # The command starts a persistent worker, which receives sampled args for each trial.
+        self.persistent = bool(self.config.get("worker"))
+        if self.persistent and ("${args_no_hyphens}" in self.config["command"]):
+            raise ValueError("Worker command can't contain ${args_no_hyphens}")
+        # Completed trials with the same arguments and command are reused if deduplication is enabled.
+        dedup = self.config.get("dedup")
+        self.dedup = bool(dedup)
+        self.dedup_sweeps = dedup.get("sweeps", []) if isinstance(dedup, dict) else []
+        # Indices of the sweep and extra sweeps (see DedupIndex).
+        self._dedup_indices = None
+        self._dedup_lock = threading.Lock()
+        # Trial number -> time when the objective returned, used to measure tell.
+        self._finish_times = {}
+        # Wall-clock limit for a trial in seconds.
+        self.timeout = self.config.get("trial_timeout", None)
+        self.retry = make_retry_callback(self.config)
+        # Limits of the whole sweep, which are checked in the Sweeps table before starting trials.
+        self.budget = self.config.get("budget") or {}
+        self._sweep_db = get_sweep_db() if self.budget else None
         self.cmd_args = cmd_args
+        self.slots = slots if slots is not None else make_slots(1)
+        # Indices of the slots, which are not occupied by running trials.
+        self.free_slots = queue.Queue()
+        for i in range(len(self.slots)):
+            self.free_slots.put(i)
+
+        tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
+        if tracking_uri is None:
+            raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
+        # The client is shared between parallel slots.
+        self.client = get_client(tracking_uri)
 
     @property
     def default_count(self):
         return self.config["run_cap"]
 
+    @property
+    def parallel(self):
+        return len(self.slots)
+
+    def close(self):
+        """Stop persistent workers."""
+        for slot in self.slots:
+            worker = slot.pop("worker", None)
+            if worker is not None:
+                worker.close()
+
+    def check_budget(self):
+        """Check the sweep budget in the shared storage.
+
+        Returns:
+            The description of the exhausted limit or None if new trials can be started.
+        """
+        if not self.budget:
+            return None
+        deadline = self.config.get("_deadline_")
+        if (deadline is not None) and (time.time() >= deadline):
+            return f"deadline {self.budget.get('deadline') or time.ctime(deadline)} passed"
+        usage = self._sweep_db.get_budget_usage(self.sweep_id)
+        max_trials = self.budget.get("max_trials")
+        if (max_trials is not None) and (usage["trials_started"] >= max_trials):
+            return f"started {usage['trials_started']} of {max_trials} trials"
+        cpu_hours = self.budget.get("cpu_hours")
+        if (cpu_hours is not None) and (usage["cpu_seconds"] >= cpu_hours * 3600):
+            return f"used {usage['cpu_seconds'] / 3600:.3g} of {cpu_hours} CPU hours"
+        return None
+
+    def _claim_trials(self, count):
+        """Reserve trials in the sweep budget before starting them.
+
+        Returns:
+            The number of trials, which can be started.
+        """
+        if not self.budget:
+            return count
+        deadline = self.config.get("_deadline_")
+        claimed = 0
+        if (deadline is None) or (time.time() < deadline):
+            cpu_hours = self.budget.get("cpu_hours")
+            kwargs = {
+                "max_trials": self.budget.get("max_trials"),
+                "max_cpu_seconds": cpu_hours * 3600 if cpu_hours is not None else None
+            }
+            if self._sweep_db.claim_trials(self.sweep_id, count, **kwargs):
+                claimed = count
+            else:
+                # Claim the rest of the trial cap.
+                while (claimed < count - 1) and self._sweep_db.claim_trials(self.sweep_id, 1, **kwargs):
+                    claimed += 1
+        if claimed == 0:
+            self.set_exhausted(self.check_budget() or "no trials left")
+        return claimed
+
+    def set_exhausted(self, reason):
+        """Report the exhausted budget and mark the sweep in the Sweeps table."""
+        print(f"Sweep budget is exhausted: {reason}")
+        self._sweep_db.set_sweep_status(self.sweep_id, "exhausted")
+
+    def _add_cpu_time(self, process):
+        """Add CPU time of the finished trial process to the sweep budget usage."""
+        rusage = getattr(process, "rusage", None)
+        if self.budget and rusage:
+            self._sweep_db.add_cpu_time(self.sweep_id, rusage["resource/user_cpu"] + rusage["resource/system_cpu"])
+
     def __call__(self, trial):
+        if not self._claim_trials(1):
+            # Another agent used the rest of the budget after the previous check.
+            import optuna
+            trial.study.stop()
+            raise optuna.TrialPruned("Sweep budget is exhausted.")
+        index = self.free_slots.get()
+        try:
+            return self._run_trial(trial, self.slots[index])
+        finally:
+            self.free_slots.put(index)
+            self._finish_times[trial.number] = time.monotonic()
+
+    def after_trial(self, study, trial):
+        """Study callback, which logs the time spent on reporting the result, retries failed trials
+        and stops the study when the sweep budget is exhausted."""
+        finish_time = self._finish_times.pop(trial.number, None)
+        if finish_time is not None:
+            self._log_timings(None, trial.number, {"timing/tell": time.monotonic() - finish_time})
+        self._retry_failed(study, trial)
+        reason = self.check_budget()
+        if reason is not None:
+            self.set_exhausted(reason)
+            study.stop()
+
+    def _retry_failed(self, study, trial):
+        from optuna.trial import TrialState
+        if (self.retry is not None) and (trial.state == TrialState.FAIL):
+            self.retry(study, trial)
+
+    def optimize(self, study, n_trials, batch_size=1, catch=()):
+        """Run trials with ask/tell interface.
+
+        Trials are started in batches with sampled parameters, which reduces the number of storage requests.
+        Results are reported from a background thread. If the storage has heartbeat enabled, heartbeats are
+        recorded for all started trials, including trials waiting in the batch. Trials are claimed in the sweep
+        budget before they are asked, and the agent stops when the budget is exhausted.
+
+        Args:
+            study: Optuna study.
+            n_trials: The total number of trials.
+            batch_size: The number of trials to start at once.
+            catch: Exceptions, which mark the trial as failed without stopping the agent.
+        """
+        import optuna
+        from optuna.trial import TrialState
+
+        lock = threading.Lock()
+        pending = collections.deque()
+        remaining = n_trials
+        errors = []
+        reporter = ThreadPoolExecutor(max_workers=1)
+        reports = []
+        # Trial number -> sampling time.
+        ask_times = {}
+        # IDs of started trials, which are not reported yet.
+        active = set()
+        # Journal storage doesn't support heartbeats.
+        heartbeat_interval = (study._storage.get_heartbeat_interval()
+                              if hasattr(study._storage, "get_heartbeat_interval") else None)
+        stop_heartbeat = threading.Event()
+
+        def record_heartbeats():
+            while not stop_heartbeat.wait(heartbeat_interval):
+                with lock:
+                    trial_ids = list(active)
+                for trial_id in trial_ids:
+                    study._storage.record_heartbeat(trial_id)
+
+        def next_trial():
+            nonlocal remaining
+            with lock:
+                if errors:
+                    return None
+                if not pending:
+                    size = self._claim_trials(min(batch_size, remaining)) if remaining > 0 else 0
+                    if size == 0:
+                        remaining = 0
+                        return None
+                    start = time.monotonic()
+                    if heartbeat_interval is not None:
+                        with warnings.catch_warnings():
+                            warnings.simplefilter("ignore", optuna.exceptions.ExperimentalWarning)
+                            optuna.storages.fail_stale_trials(study)
+                    trials = self.sampler.ask(study, size)
+                    if heartbeat_interval is not None:
+                        for trial in trials:
+                            study._storage.record_heartbeat(trial._trial_id)
+                    active.update(trial._trial_id for trial in trials)
+                    duration = (time.monotonic() - start) / size
+                    ask_times.update({trial.number: duration for trial in trials})
+                    pending.extend(trials)
+                    remaining -= size
+                return pending.popleft()
+
+        def tell(trial, value, state):
+            start = time.monotonic()
+            frozen_trial = study.tell(trial, value, state=state)
+            self._log_timings(None, trial.number, {"timing/tell": time.monotonic() - start})
+            self._retry_failed(study, frozen_trial)
+
+        def report(trial, value=None, state=None):
+            with lock:
+                active.discard(trial._trial_id)
+                reports.append(reporter.submit(tell, trial, value, state))
+
+        def work(slot):
+            while True:
+                trial = next_trial()
+                if trial is None:
+                    break
+                try:
+                    value = self._run_trial(trial, slot, timings={"timing/sample": ask_times.pop(trial.number)})
+                except optuna.TrialPruned:
+                    report(trial, state=TrialState.PRUNED)
+                except Exception as e:
+                    report(trial, state=TrialState.FAIL)
+                    if not isinstance(e, catch):
+                        with lock:
+                            errors.append(e)
+                        break
+                    print(f"Trial {trial.number} failed: {e}")
+                else:
+                    report(trial, value)
+
+        if heartbeat_interval is not None:
+            threading.Thread(target=record_heartbeats, daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallel) as workers:
+                for future in [workers.submit(work, slot) for slot in self.slots]:
+                    future.result()
+        finally:
+            stop_heartbeat.set()
+            # Trials, which were started but not run.
+            for trial in pending:
+                report(trial, state=TrialState.FAIL)
+            reporter.shutdown()
+        for future in reports:
+            future.result()
+        if errors:
+            raise errors[0]
+
+    def _run_trial(self, trial, slot, timings=None):
+        """Run the trial command and get the metric.
+
+        Raises:
+            TrialError if the trial failed. Storage errors are raised as is.
+        """
+        import optuna
+        try:
+            return self._run_command(trial, slot, timings=timings)
+        except (optuna.TrialPruned, TrialError, optuna.exceptions.StorageInternalError, sa.exc.SQLAlchemyError):
+            raise
+        except Exception as e:
+            raise TrialError(f"{type(e).__name__}: {e}") from e
+
+    def _run_command(self, trial, slot, timings=None):
         # Sample parameters.
-        tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
-        if tracking_uri is None:
-            raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
-        client = MlflowClient(tracking_uri)
+        timings = dict(timings or {})
+        start = time.monotonic()
         args = self.sampler.sample(trial)
+        timings["timing/sample"] = timings.get("timing/sample", 0) + time.monotonic() - start
 
         # Construct command.
         cmd = []
@@ -55,40 +517,244 @@ class Agent:
                 cmd.append(token)
         if self.cmd_args is not None:
             cmd = cmd + self.cmd_args
+        if self.dedup:
+            key = get_trial_hash(args, cmd)
+            trial.set_user_attr(HASH_ATTR, key)
+            source, hits = self._find_duplicate(trial.study, key)
+            if source is not None:
+                return self._reuse(trial, source, hits + 1)
+        if slot["cpus"] is not None:
+            cmd = ["taskset", "--cpu-list", slot["cpus"]] + cmd
+        env.update(slot["env"])
 
-        with tempfile.NamedTemporaryFile("r") as fp_info:
+        metric_names = [metric["name"] for metric in get_sweep_metrics(self.config)]
+        with tempfile.NamedTemporaryFile("r") as fp_info, tempfile.NamedTemporaryFile("r") as fp_report:
             # Setup MLflow environment.
-            env.update({
+            trial_env = {
                 "MLFLOW_INFO_FILE": fp_info.name,
                 "MLFLOW_PARENT_RUN_ID": self.config["_parent_mlflow_run_id_"],
                 "MLFLOW_EXPERIMENT_NAME": self.config["project"],
                 "MLFLOW_TAGS": env.get("MLFLOW_TAGS", "") + ";" + f"sweep_id={self.sweep_id};sweep_index={trial.number}"
-            })
-            print("Environment:", env)
+            }
+            if self.pruning:
+                trial_env.update({
+                    "MLFLOW_REPORT_FILE": fp_report.name,
+                    "MLFLOW_REPORT_METRIC": metric_names[0]
+                })
+            print("Environment:", dict(env, **trial_env))
 
             # Run.
             print("Run:", cmd)
-            result = sp.run(cmd, env=env)
-            if result.returncode != 0:
-                raise RuntimeError(f"Subprocess failed with exit code: {result.returncode}.")
-            run_id = json.load(fp_info)["run_id"]
+            start = time.monotonic()
+            if self.persistent:
+                process = self._get_worker(slot, cmd, env)
+                process.submit(args, trial_env)
+            else:
+                process = sp.Popen(cmd, env=dict(env, **trial_env))
+            timings["timing/launch"] = time.monotonic() - start
+            start = time.monotonic()
+            try:
+                if self.pruning:
+                    step = self._wait(process, trial, fp_report, timeout=self.timeout)
+                elif self.persistent:
+                    process.wait(timeout=self.timeout)
+                    step = None
+                else:
+                    wait_process(process, timeout=self.timeout)
+                    step = None
+            except sp.TimeoutExpired:
+                self._stop(process, slot)
+                self._set_killed(fp_info)
+                self._add_cpu_time(process)
+                raise TrialError(f"Trial {trial.number} exceeded the time limit of {self.timeout} seconds.") from None
+            except BaseException:
+                self._stop(process, slot)
+                self._add_cpu_time(process)
+                raise
+            timings["timing/run"] = time.monotonic() - start
+            if step is not None:
+                self._stop(process, slot)
+                self._set_killed(fp_info)
+                self._add_cpu_time(process)
+                self._log_timings(None, trial.number, timings)
+                import optuna
+                raise optuna.TrialPruned(f"Trial {trial.number} pruned at step {step}.")
+            self._add_cpu_time(process)
+            timings.update(getattr(process, "rusage", None) or {})
+            timings["resource/exit_code"] = process.returncode
+            if process.returncode != 0:
+                self._log_timings(None, trial.number, timings)
+                raise TrialError(f"Subprocess failed with exit code: {process.returncode}.")
+            info = json.load(fp_info)
+        run_id = info["run_id"]
+        if self.dedup:
+            trial.set_user_attr(RUN_ID_ATTR, run_id)
+
+        # Extract metric. Final values are written to the info file by the logger.
+        start = time.monotonic()
+        run_client = self._get_run_client(info)
+        metrics = info.get("metrics", {})
+        if not all(name in metrics for name in metric_names):
+            # The process didn't finalize the logger.
+            metrics = run_client.get_run(run_id).data.metrics
+        timings["timing/fetch"] = time.monotonic() - start
+        if "timing" in info:
+            timings["timing/train"] = info["timing"]["duration"]
+        self._log_timings(run_id, trial.number, timings, run_client=run_client)
+        values = [metrics[name] for name in metric_names]
+        return values[0] if len(values) == 1 else values
+
+    def _get_run_client(self, info):
+        """Get the client for the trial run, which can be written to a local spool."""
+        spool_dir = info.get("spool_dir", None)
+        return self.client if spool_dir is None else SpoolClient(spool_dir)
+
+    def _log_timings(self, run_id, number, metrics, run_client=None):
+        """Log timing and resource metrics to the trial run and to the parent run with trial number as step."""
+        from mlflow.entities import Metric
+
+        timestamp = int(time.time() * 1000)
+        if run_id is not None:
+            run_client = run_client or self.client
+            run_client.log_batch(run_id, metrics=[Metric(k, v, timestamp, 0) for k, v in metrics.items()])
+        self.client.log_batch(self.config["_parent_mlflow_run_id_"],
+                              metrics=[Metric(k, v, timestamp, number) for k, v in metrics.items()])
+
+    def _get_worker(self, slot, cmd, env):
+        """Get the worker of the slot, starting a new one if necessary."""
+        worker = slot.get("worker", None)
+        if (worker is None) or (not worker.alive):
+            print("Start worker:", cmd)
+            worker = WorkerClient(cmd, env)
+            slot["worker"] = worker
+        return worker
 
-        # Extract metric.
-        metric_name = self.config["metric"]["name"]
-        run = client.get_run(run_id)
-        metrics = run.data.metrics
-        metric = metrics[metric_name]
-        return metric
+    def _stop(self, process, slot):
+        """Stop the trial process or the worker."""
+        if isinstance(process, WorkerClient):
+            slot.pop("worker", None)
+            process = process.process
+        terminate(process)
+
+    def _find_duplicate(self, study, key):
+        """Find a completed trial with the given hash in the study and in extra sweeps.
+
+        Returns:
+            A tuple of source (sweep ID and frozen trial or None) and the number of reused trials in the study.
+        """
+        with self._dedup_lock:
+            if self._dedup_indices is None:
+                self._dedup_indices = [DedupIndex(study._storage, sweep_id)
+                                       for sweep_id in [study.study_name] + self.dedup_sweeps]
+        source = None
+        for index in self._dedup_indices:
+            index.update()
+            trial = index.trials.get(key)
+            if trial is not None:
+                source = (index.sweep_id, trial)
+                break
+        return source, len(self._dedup_indices[0].reused)
+
+    def _reuse(self, trial, source, hits):
+        """Finish the trial with values of the completed one."""
+        sweep_id, source_trial = source
+        print(f"Reuse trial {source_trial.number} from {sweep_id}")
+        trial.set_user_attr(DEDUP_SOURCE_ATTR, f"{sweep_id}:{source_trial.number}")
+        run_id = source_trial.user_attrs.get(RUN_ID_ATTR)
+        if run_id is not None:
+            trial.set_user_attr(RUN_ID_ATTR, run_id)
+        self.client.log_metric(self.config["_parent_mlflow_run_id_"], "dedup_hits", hits, step=trial.number)
+        values = source_trial.values
+        return values[0] if len(values) == 1 else list(values)
+
+    def _wait(self, process, trial, fp_report, timeout=None):
+        """Wait for the process, reporting intermediate values to the trial.
+
+        The process appends JSON lines with step and value to the report file.
+
+        Returns:
+            The step at which the trial must be pruned or None if the process finished.
+
+        Raises:
+            TimeoutExpired if the process didn't finish in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tail = ""
+        while True:
+            poll_interval = REPORT_POLL_INTERVAL
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    raise sp.TimeoutExpired(f"trial {trial.number}", timeout)
+                poll_interval = max(0, min(poll_interval, deadline - time.monotonic()))
+            try:
+                if isinstance(process, WorkerClient):
+                    process.wait(timeout=poll_interval)
+                else:
+                    wait_process(process, timeout=poll_interval)
+                finished = True
+            except sp.TimeoutExpired:
+                finished = False
+            # The last line can be incomplete.
+            *lines, tail = (tail + fp_report.read()).split("\n")
+            for line in lines:
+                if not line:
+                    continue
+                record = json.loads(line)
+                trial.report(record["value"], record["step"])
+                if (not finished) and trial.should_prune():
+                    return record["step"]
+            if finished:
+                return None
+
+    def _set_killed(self, fp_info):
+        """Mark MLflow run of the stopped process as killed."""
+        fp_info.seek(0)
+        try:
+            info = json.load(fp_info)
+        except ValueError:
+            # The run wasn't created.
+            return
+        self._get_run_client(info).set_terminated(info["run_id"], "KILLED")
 
 
 def main(args):
+    import optuna
+
     storage = get_optuna_storage()
-    study = optuna.load_study(study_name=args.sweep_id, storage=storage)
+    sweep_config = get_sweep_db().get_sweep_config(args.sweep_id)
+    sampler_defaults = {}
+    if args.batch_size > 1:
+        if sweep_config["method"] == "grid":
+            raise ValueError("Batched mode is not supported for grid search")
+        if sweep_config["method"] == "bayes":
+            # Batched trials are sampled before previous ones finish, so pending trials are considered by the sampler.
+            sampler_defaults["constant_liar"] = True
+    if sweep_config.get("heartbeat_interval") is not None:
+        enable_heartbeat(storage, sweep_config["heartbeat_interval"],
+                         grace_period=sweep_config.get("grace_period", None),
+                         callback=make_retry_callback(sweep_config))
+    study = optuna.load_study(study_name=args.sweep_id, storage=storage,
+                              # Parallel slots share the sampler, while agents get different seeds.
+                              sampler=make_sampler(sweep_config, seed_key=f"{socket.gethostname()}:{os.getpid()}",
+                                                   **sampler_defaults),
+                              pruner=make_pruner(sweep_config.get("pruner")))
 
-    sweep_config = SweepDB(engine=storage.engine).get_sweep_config(args.sweep_id)
-    agent = Agent(args.sweep_id, sweep_config, cmd_args=args.args)
+    slots = make_slots(args.parallel, cpus=args.slot_cpus, env=args.slot_env)
+    agent = Agent(args.sweep_id, sweep_config, cmd_args=args.args, slots=slots)
     count = args.count if args.count is not None else agent.default_count
-    study.optimize(agent, n_trials=count)
+    reason = agent.check_budget()
+    if reason is not None:
+        agent.set_exhausted(reason)
+        return
+    # Failed trials are marked as failed and the agent proceeds with other trials.
+    catch = (TrialError,)
+    try:
+        if args.batch_size > 1:
+            agent.optimize(study, count, batch_size=args.batch_size, catch=catch)
+        else:
+            study.optimize(agent, n_trials=count, n_jobs=agent.parallel, catch=catch, callbacks=[agent.after_trial])
+    finally:
+        agent.close()
 
 
 if __name__ == "__main__":
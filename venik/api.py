@@ -3,31 +3,87 @@ import os
 import sys
 import yaml
 
-from mlflow.tracking import MlflowClient
+from .cache import RunCache
+from .tracking import iter_experiments, iter_runs
 
 
-def parse_arguments():
+# The maximum number of run IDs in a single search request.
+MAX_SEARCH_RUNS = 100
+
+
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser("Fetch information from MLFlow api")
     parser.add_argument("command", choices=["parameters", "metrics"])
-    parser.add_argument("run_id", help="The ID of the run")
-    args = parser.parse_args()
+    parser.add_argument("run_id", help="The ID of the run or - to read multiple IDs from stdin")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use local cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached values and update the cache")
+    args = parser.parse_args(argv)
     return args
 
 
+def get_run_data(run):
+    return {
+        "parameters": dict(run.data.params),
+        "metrics": dict(run.data.metrics)
+    }
+
+
+def fetch_runs(client, run_ids):
+    """Get data of multiple runs.
+
+    A single run is requested directly, while multiple runs are found with search requests.
+
+    Returns:
+        Mapping from run ID to the pair of status and data.
+    """
+    from mlflow.entities import ViewType
+
+    if len(run_ids) == 1:
+        run = client.get_run(run_ids[0])
+        return {run.info.run_id: (run.info.status, get_run_data(run))}
+    experiment_ids = [e.experiment_id for e in iter_experiments(client, view_type=ViewType.ALL)]
+    result = {}
+    for i in range(0, len(run_ids), MAX_SEARCH_RUNS):
+        ids = ", ".join(f"'{run_id}'" for run_id in run_ids[i:i + MAX_SEARCH_RUNS])
+        for run in iter_runs(client, experiment_ids, f"attributes.run_id IN ({ids})",
+                             run_view_type=ViewType.ALL):
+            result[run.info.run_id] = (run.info.status, get_run_data(run))
+    missing = set(run_ids) - set(result)
+    if missing:
+        raise KeyError(f"Runs not found: {', '.join(sorted(missing))}")
+    return result
+
+
 def main(args):
     tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
     if tracking_uri is None:
         raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
-    client = MlflowClient(tracking_uri)
-    run = client.get_run(args.run_id)
-    if args.command == "parameters":
-        result = run.data.params
-    elif args.command == "metrics":
-        result = run.data.metrics
+    batch = args.run_id == "-"
+    run_ids = list(dict.fromkeys(sys.stdin.read().split())) if batch else [args.run_id]
+
+    cache = None if args.no_cache else RunCache()
+    try:
+        cached = {} if (cache is None or args.refresh) else cache.get(run_ids)
+        missing = [run_id for run_id in run_ids if run_id not in cached]
+        if missing:
+            from mlflow.tracking import MlflowClient
+            client = MlflowClient(tracking_uri)
+            for run_id, (status, data) in fetch_runs(client, missing).items():
+                cached[run_id] = data
+                if cache is not None:
+                    cache.put(run_id, status, data)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    results = {}
+    for run_id in run_ids:
+        result = cached[run_id][args.command]
+        results[run_id] = {k: v for k, v in sorted(result.items())}
+    if batch:
+        yaml.safe_dump(results, sys.stdout)
     else:
-        assert False
-    result = {k: v for k, v in sorted(result.items())}
-    yaml.safe_dump(result, sys.stdout)
+        yaml.safe_dump(results[args.run_id], sys.stdout)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,98 @@
+import json
+import os
+import sqlite3
+import time
+
+
+FINISHED_STATUSES = ["FINISHED", "FAILED", "KILLED"]
+DEFAULT_TTL = 60
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+def get_cache_path():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(root, "venik", "runs.sqlite")
+
+
+class RunCache:
+    """Local cache of run data.
+
+    Finished runs are stored permanently, while unfinished ones expire after ttl seconds.
+    The least recently used runs are evicted when the total size exceeds max_size bytes.
+    Defaults can be changed with VENIK_CACHE_TTL and VENIK_CACHE_MAX_SIZE environment variables.
+
+    Args:
+        path: SQLite file path (default: $XDG_CACHE_HOME/venik/runs.sqlite).
+        ttl: The lifetime of unfinished runs in seconds.
+        max_size: The maximum total size of the cached data in bytes.
+    """
+    def __init__(self, path=None, ttl=None, max_size=None):
+        if path is None:
+            path = get_cache_path()
+        if ttl is None:
+            ttl = float(os.environ.get("VENIK_CACHE_TTL", DEFAULT_TTL))
+        if max_size is None:
+            max_size = int(os.environ.get("VENIK_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE))
+        self.ttl = ttl
+        self.max_size = max_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        with self.conn:
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                finished INTEGER,
+                data TEXT,
+                size INTEGER,
+                fetched_at REAL,
+                accessed_at REAL
+            );
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS runs_accessed_at ON runs (accessed_at);")
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, run_ids):
+        """Get cached data.
+
+        Returns:
+            Mapping from run ID to the data for cached runs.
+        """
+        now = time.time()
+        result = {}
+        with self.conn:
+            for run_id in run_ids:
+                row = self.conn.execute("SELECT finished, data, fetched_at FROM runs WHERE run_id = ?;",
+                                        (run_id,)).fetchone()
+                if row is None:
+                    continue
+                finished, data, fetched_at = row
+                if (not finished) and (now - fetched_at > self.ttl):
+                    continue
+                result[run_id] = json.loads(data)
+                self.conn.execute("UPDATE runs SET accessed_at = ? WHERE run_id = ?;", (now, run_id))
+        return result
+
+    def put(self, run_id, status, data):
+        now = time.time()
+        data = json.dumps(data)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?);",
+                              (run_id, status in FINISHED_STATUSES, data, len(data), now, now))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used runs until the cache fits max_size."""
+        with self.conn:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM runs;").fetchone()[0]
+            if total <= self.max_size:
+                return
+            rows = self.conn.execute("SELECT run_id, size FROM runs ORDER BY accessed_at;")
+            evicted = []
+            for run_id, size in rows:
+                if total <= self.max_size:
+                    break
+                evicted.append((run_id,))
+                total -= size
+            self.conn.executemany("DELETE FROM runs WHERE run_id = ?;", evicted)
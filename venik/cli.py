@@ -0,0 +1,47 @@
+import importlib
+import sys
+
+
+# Subcommand -> (module, entry point, description).
+# Modules are imported only when the subcommand is called.
+COMMANDS = {
+    "sweep": ("venik.sweep", "init_sweep", "Start sweep"),
+    "agent": ("venik.agent", "main", "Run sweep agent"),
+    "list": ("venik.list_sweeps", "list_sweeps", "List sweeps"),
+    "api": ("venik.api", "main", "Fetch run parameters or metrics"),
+    "gather": ("venik.gather", "main", "Extract parameters and metrics from runs matching a regexp"),
+    "plot": ("venik.plot", "main", "Download metric timeseries for runs matching a regexp"),
+    "worker": ("venik.worker", "main", "Run sweep trials in a persistent process"),
+    "timings": ("venik.timings", "main", "Show time and resources spent by sweep trials"),
+    "status": ("venik.status", "main", "Show sweep progress and best trials"),
+    "sync": ("venik.sync", "main", "Upload runs logged in spool mode")
+}
+
+
+def print_usage(file=sys.stdout):
+    print("usage: venik <command> [<args>]", file=file)
+    print("", file=file)
+    print("Commands:", file=file)
+    width = max(map(len, COMMANDS))
+    for name, (_, _, description) in COMMANDS.items():
+        print(f"  {name.ljust(width)}  {description}", file=file)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if (not argv) or (argv[0] in ["-h", "--help"]):
+        print_usage()
+        return
+    name = argv[0]
+    if name not in COMMANDS:
+        print(f"Unknown command: {name}", file=sys.stderr)
+        print_usage(file=sys.stderr)
+        sys.exit(2)
+    module_name, entry_point, _ = COMMANDS[name]
+    module = importlib.import_module(module_name)
+    args = module.parse_arguments(argv[1:])
+    getattr(module, entry_point)(args)
+
+
+if __name__ == "__main__":
+    main()
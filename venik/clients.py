@@ -0,0 +1,123 @@
+import atexit
+import queue
+import threading
+import time
+
+
+# MLflow limits for a single log_batch request.
+MAX_BATCH_METRICS = 1000
+MAX_BATCH_PARAMS = 100
+MAX_BATCH_TAGS = 100
+
+
+class AsyncMlflowClient:
+    """MLflow client wrapper, which sends log_batch requests from a background thread.
+
+    Metrics, parameters and tags are put into a bounded queue and are sent in coalesced batches.
+    When the queue is full, logging blocks until the background thread catches up.
+    Other methods are forwarded to the wrapped client. Pending records are flushed
+    before the run is terminated, on close and at process exit.
+
+    Args:
+        client: MLflow client.
+        flush_interval: The maximum delay in seconds before sending logged records.
+        batch_size: The number of records, which triggers sending before flush_interval elapses.
+        max_queue_size: The maximum number of pending log_batch calls.
+    """
+    _STOP = object()
+
+    def __init__(self, client, flush_interval=1.0, batch_size=1000, max_queue_size=10000):
+        self._client = client
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(max_queue_size)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="venik-mlflow-logger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=(), **kwargs):
+        if self._closed:
+            return self._client.log_batch(run_id, metrics=metrics, params=params, tags=tags)
+        self._raise_error()
+        self._queue.put((run_id, list(metrics), list(params), list(tags)))
+
+    def set_terminated(self, run_id, *args, **kwargs):
+        self.flush()
+        return self._client.set_terminated(run_id, *args, **kwargs)
+
+    def flush(self):
+        """Wait until all pending records are sent."""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+        self._raise_error()
+
+    def close(self):
+        """Flush pending records and stop the background thread."""
+        if self._closed:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._closed = True
+        atexit.unregister(self.close)
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Asynchronous MLflow logging failed") from error
+
+    def _worker(self):
+        batch = []
+        size = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, tuple):
+                batch.append(item)
+                size += sum(map(len, item[1:]))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if size < self.batch_size:
+                    continue
+            # Send on timeout, flush, stop or when the batch is full.
+            self._send(batch)
+            batch = []
+            size = 0
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is self._STOP:
+                return
+
+    def _send(self, batch):
+        by_run = {}
+        for run_id, metrics, params, tags in batch:
+            run_metrics, run_params, run_tags = by_run.setdefault(run_id, ([], {}, {}))
+            run_metrics.extend(metrics)
+            # MLflow rejects duplicate keys within a single request.
+            run_params.update((param.key, param) for param in params)
+            run_tags.update((tag.key, tag) for tag in tags)
+        for run_id, (metrics, params, tags) in by_run.items():
+            params = list(params.values())
+            tags = list(tags.values())
+            try:
+                for i in range(0, len(params), MAX_BATCH_PARAMS):
+                    self._client.log_batch(run_id, params=params[i:i + MAX_BATCH_PARAMS])
+                for i in range(0, len(tags), MAX_BATCH_TAGS):
+                    self._client.log_batch(run_id, tags=tags[i:i + MAX_BATCH_TAGS])
+                for i in range(0, len(metrics), MAX_BATCH_METRICS):
+                    self._client.log_batch(run_id, metrics=metrics[i:i + MAX_BATCH_METRICS])
+            except Exception as e:
+                self._error = e
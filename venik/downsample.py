@@ -0,0 +1,227 @@
+import functools
+import struct
+
+import numpy as np
+
+
+HISTORY_DTYPE = np.dtype([("step", np.int64), ("timestamp", np.int64), ("value", np.float64)])
+# Buckets of the LTTB preselection per output point.
+LTTB_OVERSAMPLING = 4
+
+
+def to_history_array(array):
+    """Convert a list of (step, timestamp, value) or an array of points into a structured array sorted by step."""
+    array = np.array(array, dtype=HISTORY_DTYPE)
+    array.sort(order=["step", "timestamp"])
+    return array
+
+
+def lttb(array, n):
+    """Largest-Triangle-Three-Buckets downsampling of the history sorted by step."""
+    if (n >= len(array)) or (len(array) <= 2):
+        return array
+    if n < 3:
+        return array[[0, len(array) - 1]]
+    x = array["step"].astype(np.float64)
+    y = array["value"]
+    # Points between the first and the last ones are split into n - 2 buckets.
+    edges = np.linspace(1, len(array) - 1, n - 1).astype(np.int64)
+    selected = [0]
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = len(array) - 1, len(array)
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+        areas = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    selected.append(len(array) - 1)
+    return array[selected]
+
+
+class EveryDownsampler:
+    """Keep every n-th point of the history."""
+    def __init__(self, n):
+        self.n = n
+        self._count = 0
+        self._chunks = []
+
+    def update(self, array):
+        start = (-self._count) % self.n
+        self._chunks.append(array[start::self.n].copy())
+        self._count += len(array)
+
+    def result(self):
+        return to_history_array(np.concatenate(self._chunks) if self._chunks else [])
+
+
+class BucketDownsampler:
+    """Aggregate points in time buckets.
+
+    The mean mode produces a point for each bucket with the bucket start time, the last step and the mean value.
+    The minmax mode keeps points with the minimum and the maximum values of each bucket.
+
+    Args:
+        seconds: Bucket width.
+        mode: Either "mean" or "minmax".
+    """
+    def __init__(self, seconds, mode="mean"):
+        if mode not in ["mean", "minmax"]:
+            raise ValueError(f"Unknown aggregation: {mode}")
+        self.width = max(int(seconds * 1000), 1)
+        self.mode = mode
+        # Bucket -> [sum, count, last step] or [min point, max point].
+        self._buckets = {}
+
+    def update(self, array):
+        if not len(array):
+            return
+        buckets, inverse = np.unique(array["timestamp"] // self.width, return_inverse=True)
+        if self.mode == "mean":
+            sums = np.bincount(inverse, weights=array["value"])
+            counts = np.bincount(inverse)
+            steps = np.full(len(buckets), np.iinfo(np.int64).min)
+            np.maximum.at(steps, inverse, array["step"])
+            for bucket, total, count, step in zip(buckets.tolist(), sums.tolist(), counts.tolist(), steps.tolist()):
+                record = self._buckets.setdefault(bucket, [0.0, 0, step])
+                record[0] += total
+                record[1] += count
+                record[2] = max(record[2], step)
+        else:
+            order = np.lexsort((array["value"], inverse))
+            starts = np.searchsorted(inverse[order], np.arange(len(buckets)))
+            ends = np.append(starts[1:], len(order))
+            for bucket, low, high in zip(buckets.tolist(), array[order[starts]], array[order[ends - 1]]):
+                record = self._buckets.get(bucket)
+                if record is None:
+                    self._buckets[bucket] = [low, high]
+                    continue
+                if low["value"] < record[0]["value"]:
+                    record[0] = low
+                if high["value"] > record[1]["value"]:
+                    record[1] = high
+
+    def result(self):
+        if self.mode == "mean":
+            return to_history_array([(step, bucket * self.width, total / count)
+                                     for bucket, (total, count, step) in self._buckets.items()])
+        points = {tuple(point.tolist()) for pair in self._buckets.values() for point in pair}
+        return to_history_array(list(points))
+
+
+class LTTBDownsampler:
+    """Largest-Triangle-Three-Buckets downsampling of a history, which doesn't fit into memory.
+
+    Points are preselected as minimums and maximums of buckets with an equal number of points. When the number
+    of buckets exceeds LTTB_OVERSAMPLING * n, adjacent buckets are merged. LTTB is applied to preselected points
+    together with the first and the last points of the history.
+
+    Args:
+        n: The number of output points.
+    """
+    def __init__(self, n):
+        self.n = n
+        self.max_buckets = LTTB_OVERSAMPLING * n
+        self.bucket_size = 1
+        self._mins = np.empty(0, dtype=HISTORY_DTYPE)
+        self._maxs = np.empty(0, dtype=HISTORY_DTYPE)
+        # Points of the incomplete last bucket.
+        self._tail = np.empty(0, dtype=HISTORY_DTYPE)
+        # The first and the last points are always kept by LTTB.
+        self._ends = np.empty(0, dtype=HISTORY_DTYPE)
+
+    def update(self, array):
+        if not len(array):
+            return
+        self._ends = np.concatenate([self._ends[:1], array[[0, -1]]])
+        array = np.concatenate([self._tail, array])
+        complete = len(array) // self.bucket_size * self.bucket_size
+        groups = array[:complete].reshape(-1, self.bucket_size)
+        rows = np.arange(len(groups))
+        self._mins = np.concatenate([self._mins, groups[rows, groups["value"].argmin(axis=1)]])
+        self._maxs = np.concatenate([self._maxs, groups[rows, groups["value"].argmax(axis=1)]])
+        self._tail = array[complete:].copy()
+        while len(self._mins) > self.max_buckets:
+            self._merge()
+
+    def _merge(self):
+        # The last bucket stays unpaired if the number of buckets is odd.
+        paired = len(self._mins) // 2 * 2
+        mins = self._mins[:paired].reshape(-1, 2)
+        maxs = self._maxs[:paired].reshape(-1, 2)
+        rows = np.arange(len(mins))
+        self._mins = np.concatenate([mins[rows, mins["value"].argmin(axis=1)], self._mins[paired:]])
+        self._maxs = np.concatenate([maxs[rows, maxs["value"].argmax(axis=1)], self._maxs[paired:]])
+        self.bucket_size *= 2
+
+    def result(self):
+        points = np.unique(np.concatenate([self._ends, self._mins, self._maxs, self._tail]))
+        return lttb(to_history_array(points), self.n)
+
+
+DOWNSAMPLERS = {
+    "every": (EveryDownsampler, int),
+    "mean": (functools.partial(BucketDownsampler, mode="mean"), float),
+    "minmax": (functools.partial(BucketDownsampler, mode="minmax"), float),
+    "lttb": (LTTBDownsampler, int)
+}
+
+
+def make_downsampler_factory(spec):
+    """Parse the downsampling method in the form <method>:<argument>.
+
+    Methods are every:<n>, mean:<seconds>, minmax:<seconds> and lttb:<points>.
+
+    Returns:
+        The function, which creates a new downsampler for each history.
+    """
+    name, _, argument = spec.partition(":")
+    if name not in DOWNSAMPLERS:
+        raise ValueError(f"Unknown downsampling method: {name}")
+    cls, argument_type = DOWNSAMPLERS[name]
+    try:
+        argument = argument_type(argument)
+    except ValueError:
+        raise ValueError(f"Expected {name}:<{argument_type.__name__}>, got {spec}")
+    if argument <= 0:
+        raise ValueError(f"Need a positive downsampling argument, got {spec}")
+    return functools.partial(cls, argument)
+
+
+class RawHistoryWriter:
+    """Write history points to a .npy file, which can be opened with np.load(path, mmap_mode="r").
+
+    The length of the array is written into the header on close, as it is unknown until the history is read.
+    Points are stored in the order of arrival.
+    """
+    # Width of the array length in the header.
+    LENGTH_WIDTH = 20
+
+    def __init__(self, path, dtype=HISTORY_DTYPE):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._fp = open(path, "wb")
+        self._fp.write(self._header())
+
+    def write(self, array):
+        self._fp.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.count += len(array)
+
+    def close(self):
+        self._fp.seek(0)
+        self._fp.write(self._header())
+        self._fp.close()
+
+    def _header(self):
+        # The header has a constant size, as the length is padded with spaces.
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%*d,), }" % (
+            np.lib.format.dtype_to_descr(self.dtype), self.LENGTH_WIDTH, self.count)
+        magic = np.lib.format.magic(1, 0)
+        # The total header size must be a multiple of 64 bytes.
+        padding = -(len(magic) + 2 + len(header) + 1) % 64
+        header = (header + " " * padding + "\n").encode("latin1")
+        return magic + struct.pack("<H", len(header)) + header
@@ -1,13 +1,32 @@
 import argparse
 import datetime
 import os
+import queue
 import re
+import sqlite3
+import threading
 import yaml
+from concurrent.futures import ThreadPoolExecutor
 
-from mlflow.tracking import MlflowClient
+from .manifest import Manifest, get_scope
+from .tracking import iter_experiments, iter_runs, get_run_name_filter
 
 
-def parse_arguments():
+# The maximum number of fetched runs waiting to be written.
+MAX_PENDING_RUNS = 10000
+# The number of runs written to a single-file output at once.
+CHUNK_SIZE = 1000
+TABLE_FILENAME = "runs"
+META_COLUMNS = ["run_id", "run_name", "experiment_id", "experiment_name", "status", "user_id",
+                "start_time", "end_time"]
+# SQLite tables with (run_id, key, value) rows -> the type of values.
+SQLITE_VALUE_TABLES = {
+    "params": "TEXT",
+    "metrics": "REAL"
+}
+
+
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(
         description="Extract parameters and metrics from MLflow runs matching a regexp"
     )
@@ -15,7 +34,280 @@ def parse_arguments():
     parser.add_argument(
         "target", nargs="?", default=".", help="Target folder (default: current directory)"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=8, help="The number of concurrent requests to MLflow (default: 8)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Export only new and changed runs, recording exported runs in the target folder"
+    )
+    parser.add_argument(
+        "--format", choices=list(WRITERS), default="yaml",
+        help="Output format: parameters, metrics and meta YAML files for each run (default), "
+        "or a single runs.sqlite or runs.parquet table with a row for each run"
+    )
+    return parser.parse_args(argv)
+
+
+def put(output, item, stop):
+    """Put the item into the bounded queue unless the consumer has stopped."""
+    while not stop.is_set():
+        try:
+            output.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def fetch_runs(client, experiment, pattern, filters, output, stop):
+    """Put matching runs of the experiment into the output queue."""
+    try:
+        for run in iter_runs(client, [experiment.experiment_id], filters):
+            if stop.is_set():
+                return
+            run_name = run.info.run_name or run.info.run_id
+            if pattern.search(run_name):
+                put(output, (experiment, run), stop)
+    finally:
+        # Mark the end of the experiment.
+        put(output, None, stop)
+
+
+def format_time(timestamp):
+    if not timestamp:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp / 1000, tz=datetime.timezone.utc).isoformat()
+
+
+def get_meta(experiment, run):
+    info = run.info
+    meta = {
+        "run_id": info.run_id,
+        "run_name": info.run_name or info.run_id,
+        "experiment_id": info.experiment_id,
+        "experiment_name": experiment.name,
+        "status": info.status,
+        "user_id": info.user_id,
+    }
+    if info.start_time:
+        meta["start_time"] = format_time(info.start_time)
+    if info.end_time:
+        meta["end_time"] = format_time(info.end_time)
+    return meta
+
+
+def write_run(target, experiment, run):
+    run_name = run.info.run_name or run.info.run_id
+    experiment_name = experiment.name.lstrip("/")
+    run_dir = os.path.join(target, experiment_name, run_name)
+    os.makedirs(run_dir, exist_ok=True)
+
+    run_id = run.info.run_id
+
+    params = {k: v for k, v in sorted(run.data.params.items())}
+    params_path = os.path.join(run_dir, f"parameters-{run_id}.yaml")
+    with open(params_path, "w") as f:
+        yaml.safe_dump(params, f)
+
+    metrics = {k: v for k, v in sorted(run.data.metrics.items())}
+    metrics_path = os.path.join(run_dir, f"metrics-{run_id}.yaml")
+    with open(metrics_path, "w") as f:
+        yaml.safe_dump(metrics, f)
+
+    meta = get_meta(experiment, run)
+    meta_path = os.path.join(run_dir, f"meta-{run_id}.yaml")
+    with open(meta_path, "w") as f:
+        yaml.safe_dump(meta, f)
+    return run_dir, [params_path, metrics_path, meta_path]
+
+
+class YamlWriter:
+    """Write parameters, metrics and meta of each run to separate YAML files."""
+    incremental = True
+
+    def __init__(self, target):
+        self.target = target
+        self.is_new = False
+
+    def write(self, experiment, run):
+        """Write the run.
+
+        Returns:
+            The list of (run, run_dir, paths) for runs, which were written by the call.
+            Table writers return None instead of the run folder.
+        """
+        run_dir, paths = write_run(self.target, experiment, run)
+        return [(run, run_dir, paths)]
+
+    def close(self):
+        return []
+
+    def abort(self):
+        """Stop the interrupted export.
+
+        Returns:
+            The list of runs, which were written by the call, like in write.
+        """
+        return []
+
+
+class TableWriter:
+    """Base class for writers, which put runs into a single file in chunks of CHUNK_SIZE rows."""
+    incremental = False
+    extension = None
+
+    def __init__(self, target, chunk_size=CHUNK_SIZE):
+        os.makedirs(target, exist_ok=True)
+        self.path = os.path.join(target, f"{TABLE_FILENAME}.{self.extension}")
+        # Records of the manifest are ignored if the table was removed.
+        self.is_new = not os.path.exists(self.path)
+        self.chunk_size = chunk_size
+        self._runs = []
+        self._rows = []
+
+    def write(self, experiment, run):
+        self._runs.append(run)
+        self._rows.append(self.make_row(experiment, run))
+        if len(self._rows) < self.chunk_size:
+            return []
+        return self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.write_rows(self._rows)
+        # The file isn't a part of the manifest record, as it is changed by every chunk.
+        written = [(run, None, []) for run in self._runs]
+        self._runs = []
+        self._rows = []
+        return written
+
+    def close(self):
+        return self.flush()
+
+    def abort(self):
+        # Buffered rows are dropped.
+        self._runs = []
+        self._rows = []
+        return []
+
+    def make_row(self, experiment, run):
+        raise NotImplementedError()
+
+    def write_rows(self, rows):
+        raise NotImplementedError()
+
+
+class SqliteWriter(TableWriter):
+    """Write runs to the SQLite file with the "runs" table of meta columns and "params" and "metrics" tables
+    of (run_id, key, value) rows.
+
+    Rows of exported runs are replaced, so the file supports incremental export. Tables of older versions
+    with a column for each name, which can't hold more than 2000 names, are dropped and exported again.
+    """
+    incremental = True
+    extension = "sqlite"
+
+    def __init__(self, target, chunk_size=CHUNK_SIZE):
+        super().__init__(target, chunk_size=chunk_size)
+        self.conn = sqlite3.connect(self.path)
+        with self.conn:
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({TABLE_FILENAME})")]
+            if set(columns) - set(META_COLUMNS):
+                self.conn.execute(f"DROP TABLE {TABLE_FILENAME}")
+                self.is_new = True
+            columns = ", ".join(f"{column} TEXT" for column in META_COLUMNS[1:])
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE_FILENAME} (run_id TEXT PRIMARY KEY, {columns})")
+            for table, value_type in SQLITE_VALUE_TABLES.items():
+                self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (run_id TEXT, key TEXT, value {value_type}, "
+                                  f"PRIMARY KEY (run_id, key)) WITHOUT ROWID")
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_key ON {table} (key)")
+
+    def make_row(self, experiment, run):
+        row = get_meta(experiment, run)
+        row["params"] = list(run.data.params.items())
+        row["metrics"] = list(run.data.metrics.items())
+        return row
+
+    def write_rows(self, rows):
+        placeholders = ", ".join("?" * len(META_COLUMNS))
+        run_ids = [(row["run_id"],) for row in rows]
+        with self.conn:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {TABLE_FILENAME} ({', '.join(META_COLUMNS)}) "
+                                  f"VALUES ({placeholders})",
+                                  [[row.get(column) for column in META_COLUMNS] for row in rows])
+            for table in SQLITE_VALUE_TABLES:
+                # Values of removed keys are dropped too.
+                self.conn.executemany(f"DELETE FROM {table} WHERE run_id = ?", run_ids)
+                self.conn.executemany(f"INSERT INTO {table} (run_id, key, value) VALUES (?, ?, ?)",
+                                      [(row["run_id"], key, value) for row in rows for key, value in row[table]])
+
+    def close(self):
+        written = super().close()
+        self.conn.close()
+        return written
+
+    def abort(self):
+        # Rows of complete runs are kept, as the table is incremental.
+        return self.close()
+
+
+class ParquetWriter(TableWriter):
+    """Write runs to the Parquet file with meta columns, "params" and "metrics" map columns.
+
+    Each chunk is written as a row group. The file is written from scratch on each export.
+    """
+    extension = "parquet"
+
+    def __init__(self, target, chunk_size=CHUNK_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow")
+        super().__init__(target, chunk_size=chunk_size)
+        self.pa = pa
+        self.schema = pa.schema([(column, pa.string()) for column in META_COLUMNS[:-2]] + [
+            ("start_time", pa.timestamp("ms", tz="UTC")),
+            ("end_time", pa.timestamp("ms", tz="UTC")),
+            ("params", pa.map_(pa.string(), pa.string())),
+            ("metrics", pa.map_(pa.string(), pa.float64()))
+        ])
+        # The file is renamed on close, so readers never see a file without the footer.
+        self._writer = pq.ParquetWriter(self.path + ".tmp", self.schema)
+
+    def make_row(self, experiment, run):
+        row = get_meta(experiment, run)
+        row["start_time"] = run.info.start_time or None
+        row["end_time"] = run.info.end_time or None
+        row["params"] = list(run.data.params.items())
+        row["metrics"] = list(run.data.metrics.items())
+        return row
+
+    def write_rows(self, rows):
+        table = self.pa.Table.from_pylist(rows, schema=self.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        written = super().close()
+        self._writer.close()
+        os.replace(self.path + ".tmp", self.path)
+        return written
+
+    def abort(self):
+        # The previous complete file is kept.
+        super().abort()
+        try:
+            self._writer.close()
+        finally:
+            os.remove(self.path + ".tmp")
+        return []
+
+
+WRITERS = {
+    "yaml": YamlWriter,
+    "sqlite": SqliteWriter,
+    "parquet": ParquetWriter
+}
 
 
 def main(args):
@@ -23,55 +315,80 @@ def main(args):
     if tracking_uri is None:
         raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
 
+    from mlflow.tracking import MlflowClient
     client = MlflowClient(tracking_uri)
     pattern = re.compile(args.pattern)
 
-    experiments = client.search_experiments()
-    for experiment in experiments:
-        runs = client.search_runs(experiment_ids=[experiment.experiment_id])
-        for run in runs:
-            run_name = run.info.run_name or run.info.run_id
-            if not pattern.search(run_name):
-                continue
-
-            experiment_name = experiment.name.lstrip("/")
-            run_dir = os.path.join(args.target, experiment_name, run_name)
-            os.makedirs(run_dir, exist_ok=True)
-
-            run_id = run.info.run_id
-
-            params = {k: v for k, v in sorted(run.data.params.items())}
-            params_path = os.path.join(run_dir, f"parameters-{run_id}.yaml")
-            with open(params_path, "w") as f:
-                yaml.safe_dump(params, f)
-
-            metrics = {k: v for k, v in sorted(run.data.metrics.items())}
-            metrics_path = os.path.join(run_dir, f"metrics-{run_id}.yaml")
-            with open(metrics_path, "w") as f:
-                yaml.safe_dump(metrics, f)
-
-            info = run.info
-            meta = {
-                "run_id": run_id,
-                "run_name": run_name,
-                "experiment_id": info.experiment_id,
-                "experiment_name": experiment.name,
-                "status": info.status,
-                "user_id": info.user_id,
-            }
-            if info.start_time:
-                meta["start_time"] = datetime.datetime.fromtimestamp(
-                    info.start_time / 1000, tz=datetime.timezone.utc
-                ).isoformat()
-            if info.end_time:
-                meta["end_time"] = datetime.datetime.fromtimestamp(
-                    info.end_time / 1000, tz=datetime.timezone.utc
-                ).isoformat()
-            meta_path = os.path.join(run_dir, f"meta-{run_id}.yaml")
-            with open(meta_path, "w") as f:
-                yaml.safe_dump(meta, f)
-
-            print(f"{run_dir}")
+    name_filter = get_run_name_filter(args.pattern)
+    writer_cls = WRITERS[args.format]
+    if args.incremental and (not writer_cls.incremental):
+        raise ValueError(f"Incremental export is not supported for {args.format} format")
+    writer = writer_cls(args.target)
+    manifest = Manifest(args.target, "gather") if args.incremental else None
+    scope = get_scope(pattern=args.pattern, format=args.format)
+    use_manifest = (manifest is not None) and (not writer.is_new)
+    n_written = 0
+    # Experiment ID -> the latest start time of listed runs.
+    listed = {}
+
+    def record(written):
+        nonlocal n_written
+        for run, run_dir, paths in written:
+            if manifest is not None:
+                manifest.update(run, paths, format=args.format)
+            if run_dir is not None:
+                print(run_dir)
+        n_written += len(written)
+
+    experiments = list(iter_experiments(client))
+    runs = queue.Queue(MAX_PENDING_RUNS)
+    stop = threading.Event()
+    try:
+        # Experiments are fetched concurrently, while files are written from the main thread.
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            futures = []
+            for experiment in experiments:
+                if use_manifest:
+                    filters = manifest.get_filters(experiment.experiment_id, scope, name_filter)
+                else:
+                    filters = name_filter
+                futures.append(pool.submit(fetch_runs, client, experiment, pattern, filters, runs, stop))
+            try:
+                remaining = len(futures)
+                while remaining:
+                    item = runs.get()
+                    if item is None:
+                        remaining -= 1
+                        continue
+                    experiment, run = item
+                    experiment_id = experiment.experiment_id
+                    listed[experiment_id] = max(listed.get(experiment_id, 0), run.info.start_time or 0)
+                    if use_manifest and manifest.is_unchanged(run, format=args.format):
+                        continue
+                    record(writer.write(experiment, run))
+            finally:
+                # Release fetching threads, which wait for the queue.
+                stop.set()
+        for future in futures:
+            future.result()
+    except BaseException:
+        try:
+            record(writer.abort())
+        finally:
+            if manifest is not None:
+                manifest.close()
+        raise
+    try:
+        record(writer.close())
+        if manifest is not None:
+            # Runs of all experiments are written.
+            for experiment_id, start_time in listed.items():
+                manifest.update_listed(experiment_id, scope, start_time)
+    finally:
+        if manifest is not None:
+            manifest.close()
+    if args.format != "yaml":
+        print(f"{writer.path}: {n_written} runs")
 
 
 if __name__ == "__main__":
@@ -1,17 +1,18 @@
 import argparse
 
-from .utils import SweepDB
+from .utils import get_sweep_db
 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser("List sweeps. Use environment variables for locating Optuna.")
-    args = parser.parse_args()
+    parser.add_argument("--project", help="Show only sweeps of the project")
+    args = parser.parse_args(argv)
     return args
 
 
 def list_sweeps(args):
-    db = SweepDB()
-    for r in sorted(db.get_sweeps_list(), key=lambda r: r["sweep_id"]):
+    db = get_sweep_db()
+    for r in db.get_sweeps_list(project=args.project):
         print(r["sweep_id"])
 
 
@@ -1,10 +1,16 @@
 import os
 import mlflow
 import json
+import time
 from pytorch_lightning.loggers import MLFlowLogger as MLFlowLoggerPL
+from pytorch_lightning.loggers.logger import rank_zero_experiment
 from pytorch_lightning.loggers.mlflow import _get_resolve_tags
+from pytorch_lightning.utilities import rank_zero_only
 from mlflow.tracking import MlflowClient
 
+from .clients import AsyncMlflowClient
+from .spool import SpoolClient
+
 
 class MLFlowLogger(MLFlowLoggerPL):
     """Logger extension that uses environment variables.
@@ -18,6 +24,22 @@ class MLFlowLogger(MLFlowLoggerPL):
     - MLFLOW_RUN_NAME
     - MLFLOW_TAGS
     - MLFLOW_PARENT_RUN_ID
+    - MLFLOW_ASYNC_LOGGING
+    - MLFLOW_SPOOL_DIR
+    - MLFLOW_REPORT_FILE
+    - MLFLOW_REPORT_METRIC
+
+    If MLFLOW_INFO_FILE is set, the logger writes the run ID there. When the logger is finalized, the file is
+    updated with the final value, the minimum and the maximum of each metric and the duration of the run.
+
+    If MLFLOW_REPORT_FILE is set, values of MLFLOW_REPORT_METRIC are appended to the file as JSON lines
+    with step and value. The sweep agent reads them for pruning.
+
+    Asynchronous logging sends metrics and parameters from a background thread in coalesced batches.
+    It is enabled with the async_logging argument or by setting MLFLOW_ASYNC_LOGGING to 1.
+
+    In spool mode, enabled with the spool_dir argument or MLFLOW_SPOOL_DIR, the logger doesn't contact the server.
+    The run is written to a local file with a locally generated run ID and is uploaded later with "venik sync".
     """
 
     def __init__(self, *,
@@ -28,7 +50,35 @@ class MLFlowLogger(MLFlowLoggerPL):
                  tracking_uri=None,
                  tags=None,
                  run_id=None,
+                 async_logging=None,
+                 flush_interval=1.0,  # Asynchronous logging delay in seconds.
+                 batch_size=1000,  # The number of records, which triggers asynchronous sending.
+                 max_queue_size=10000,  # The maximum number of pending asynchronous requests.
+                 spool_dir=None,
                  **kwargs):
+        if spool_dir is None:
+            spool_dir = os.environ.get("MLFLOW_SPOOL_DIR", None)
+        if (spool_dir is not None) and (run_id is not None):
+            raise ValueError("Can't continue an existing run in spool mode")
+        self._spool_dir = spool_dir
+        self._spool_client = None
+        if async_logging is None:
+            async_logging = os.environ.get("MLFLOW_ASYNC_LOGGING", "0").lower() in ["1", "true", "yes"]
+        self._async_logging = async_logging
+        self._async_kwargs = {"flush_interval": flush_interval,
+                              "batch_size": batch_size,
+                              "max_queue_size": max_queue_size}
+        self._async_client = None
+        self._report_path = os.environ.get("MLFLOW_REPORT_FILE", None)
+        self._report_metric = os.environ.get("MLFLOW_REPORT_METRIC", None)
+        self._report_step = 0
+        self._info_path = os.environ.get("MLFLOW_INFO_FILE", None)
+        # Metric name -> (step, value) of the latest value.
+        self._latest_metrics = {}
+        # Metric name -> [min, max].
+        self._metric_ranges = {}
+        self._start_time = time.time()
+
         if tracking_uri is None:
             tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
         run_name = run_name or name
@@ -43,7 +93,9 @@ class MLFlowLogger(MLFlowLoggerPL):
                     tags[name] = value
 
         parent_run_id = os.environ.get("MLFLOW_PARENT_RUN_ID", None)
-        if (parent_run_id is not None) and (run_id is None):
+        # The experiment of the parent run is requested during the upload in spool mode.
+        self._parent_run_id = parent_run_id
+        if (parent_run_id is not None) and (run_id is None) and (spool_dir is None):
             mlflow.set_tracking_uri(tracking_uri)
             client = MlflowClient()
             experiment_id = client.get_run(parent_run_id).info.experiment_id
@@ -73,9 +125,81 @@ class MLFlowLogger(MLFlowLoggerPL):
                          tags=tags,
                          run_id=run_id,
                          **kwargs)
+        if spool_dir is not None:
+            self._spool_client = SpoolClient(spool_dir)
 
-        if "MLFLOW_INFO_FILE" in os.environ:
+        if self._info_path is not None:
             # Create run and log run_id.
             client = self.experiment
-            with open(os.environ["MLFLOW_INFO_FILE"], "w") as fp:
-                json.dump({"run_id": self._run_id}, fp)
+            with open(self._info_path, "w") as fp:
+                json.dump(self._get_run_info(), fp)
+
+    @property
+    @rank_zero_experiment
+    def experiment(self):
+        if self._spool_client is not None:
+            if self._run_id is None:
+                resolve_tags = _get_resolve_tags()
+                run = self._spool_client.create_run(self._experiment_name,
+                                                    parent_run_id=self._parent_run_id,
+                                                    tags=resolve_tags(self.tags),
+                                                    run_name=self._run_name)
+                self._run_id = run.info.run_id
+                self._initialized = True
+            return self._spool_client
+        client = super().experiment
+        if not self._async_logging:
+            return client
+        if self._async_client is None:
+            self._async_client = AsyncMlflowClient(client, **self._async_kwargs)
+        return self._async_client
+
+    @rank_zero_only
+    def log_metrics(self, metrics, step=None):
+        super().log_metrics(metrics, step)
+        if self._info_path is not None:
+            for name, value in metrics.items():
+                if isinstance(value, str):
+                    continue
+                value = float(value)
+                latest_step = step or 0
+                if latest_step >= self._latest_metrics.get(name, (latest_step, None))[0]:
+                    self._latest_metrics[name] = (latest_step, value)
+                metric_range = self._metric_ranges.setdefault(name, [value, value])
+                metric_range[0] = min(metric_range[0], value)
+                metric_range[1] = max(metric_range[1], value)
+        if (self._report_path is None) or (self._report_metric not in metrics):
+            return
+        if step is None:
+            step = self._report_step
+        self._report_step = step + 1
+        with open(self._report_path, "a") as fp:
+            fp.write(json.dumps({"step": step, "value": float(metrics[self._report_metric])}) + "\n")
+
+    @rank_zero_only
+    def finalize(self, status="success"):
+        super().finalize(status)
+        if self._async_client is not None:
+            self._async_client.close()
+        if (self._info_path is not None) and (self._run_id is not None):
+            self._write_info(status)
+
+    def _write_info(self, status):
+        end_time = time.time()
+        info = self._get_run_info()
+        info.update({
+            "status": status,
+            "metrics": {name: value for name, (_, value) in self._latest_metrics.items()},
+            "summary": {name: {"min": metric_range[0], "max": metric_range[1], "step": self._latest_metrics[name][0]}
+                        for name, metric_range in self._metric_ranges.items()},
+            "timing": {"start_time": self._start_time, "end_time": end_time, "duration": end_time - self._start_time}
+        })
+        # The file is rewritten in place, as the agent keeps it open.
+        with open(self._info_path, "w") as fp:
+            json.dump(info, fp)
+
+    def _get_run_info(self):
+        info = {"run_id": self._run_id}
+        if self._spool_dir is not None:
+            info["spool_dir"] = os.path.abspath(self._spool_dir)
+        return info
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+
+
+# Each command keeps a separate manifest in the target folder.
+MANIFEST_FILENAME_FORMAT = ".venik-{}.jsonl"
+UNFINISHED_STATUSES = ["RUNNING", "SCHEDULED"]
+# Runs started shortly before the latest exported one are requested again to tolerate clock skew.
+START_TIME_OVERLAP_MS = 3600 * 1000
+# The maximum number of run IDs in a single filter.
+MAX_FILTER_RUNS = 100
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_latest_steps(run):
+    """Get step and timestamp of the latest value of each metric."""
+    metrics = getattr(run.data, "_metric_objs", None) or []
+    return {m.key: [m.step, m.timestamp] for m in metrics}
+
+
+def get_scope(**options):
+    """Get the export scope string from patterns and options."""
+    return json.dumps(options, sort_keys=True)
+
+
+class Manifest:
+    """Local record of exported runs, which makes exports incremental and resumable.
+
+    A record is appended to the manifest file after all files of the run are written, so an interrupted export
+    skips recorded runs. The latest record of a run wins. After all runs of an experiment are exported, the latest
+    start time of its runs is recorded for the export scope, and the next export with the same scope requests
+    only runs started after it. The scope must describe everything, which selects runs and their contents,
+    like name patterns and export options.
+
+    Args:
+        root: Export root directory. Paths of the files are stored relative to it.
+        command: The name of the exporting command, which selects the manifest file.
+    """
+    def __init__(self, root, command):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILENAME_FORMAT.format(command))
+        self.records = {}
+        # (experiment ID, scope) -> the latest start time of runs of completely exported listings.
+        self.listed = {}
+        self._n_lines = 0
+        if os.path.exists(self.path):
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The line was truncated by interruption.
+                        continue
+                    if "run_id" in record:
+                        self.records[record["run_id"]] = record
+                    else:
+                        key = (record["experiment_id"], record["scope"])
+                        self.listed[key] = max(self.listed.get(key, 0), record["start_time"])
+                    self._n_lines += 1
+        os.makedirs(root, exist_ok=True)
+        self._fp = open(self.path, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the manifest and remove outdated records."""
+        self._fp.close()
+        if self._n_lines > len(self.records) + len(self.listed):
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as fp:
+                for record in self.records.values():
+                    fp.write(json.dumps(record) + "\n")
+                for (experiment_id, scope), start_time in self.listed.items():
+                    fp.write(json.dumps({"experiment_id": experiment_id, "scope": scope,
+                                         "start_time": start_time}) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, run, **extra):
+        """Check the run was exported and didn't change since then.
+
+        Args:
+            run: MLflow run.
+            extra: Export options, which must match the recorded ones.
+        """
+        record = self.records.get(run.info.run_id)
+        if record is None:
+            return False
+        if (record["status"] != run.info.status) or (record["end_time"] != run.info.end_time):
+            return False
+        if record["latest"] != get_latest_steps(run):
+            return False
+        if any(record.get(k) != v for k, v in extra.items()):
+            return False
+        for path in record["files"]:
+            if not os.path.isfile(os.path.join(self.root, path)):
+                return False
+        return True
+
+    def update(self, run, files, **extra):
+        """Record the exported run.
+
+        Args:
+            run: MLflow run.
+            files: Paths of the written files.
+            extra: Export options.
+        """
+        info = run.info
+        record = {
+            "run_id": info.run_id,
+            "experiment_id": info.experiment_id,
+            "status": info.status,
+            "start_time": info.start_time,
+            "end_time": info.end_time,
+            "latest": get_latest_steps(run),
+            "files": {os.path.relpath(path, self.root): file_digest(path) for path in files}
+        }
+        record.update(extra)
+        self._fp.write(json.dumps(record) + "\n")
+        self._fp.flush()
+        self.records[info.run_id] = record
+        self._n_lines += 1
+
+    def update_listed(self, experiment_id, scope, start_time):
+        """Record that all listed runs of the experiment are exported.
+
+        Must be called after records of all runs of the listing are written.
+
+        Args:
+            experiment_id: Experiment ID.
+            scope: String, which describes the export (see get_scope).
+            start_time: The latest start time of listed runs.
+        """
+        key = (experiment_id, scope)
+        start_time = max(self.listed.get(key, 0), start_time or 0)
+        self._fp.write(json.dumps({"experiment_id": experiment_id, "scope": scope, "start_time": start_time}) + "\n")
+        self._fp.flush()
+        self.listed[key] = start_time
+        self._n_lines += 1
+
+    def get_filters(self, experiment_id, scope, filter_string=""):
+        """Get filters for runs, which could change since the previous export.
+
+        These are runs started after the latest completely exported listing, unfinished runs and runs,
+        which were unfinished during the previous export. If the experiment was never completely exported,
+        all runs are requested. Unchanged runs must be skipped with is_unchanged.
+
+        Returns:
+            The list of filters for iter_runs.
+        """
+        if (experiment_id, scope) not in self.listed:
+            return [filter_string]
+
+        def with_filter(condition):
+            return " and ".join(f for f in [filter_string, condition] if f)
+
+        records = [r for r in self.records.values() if r["experiment_id"] == experiment_id]
+        start_time = self.listed[(experiment_id, scope)] - START_TIME_OVERLAP_MS
+        filters = [with_filter(f"attributes.start_time > {start_time}")]
+        filters.extend(with_filter(f"attributes.status = '{status}'") for status in UNFINISHED_STATUSES)
+        unfinished = [r["run_id"] for r in records if r["status"] in UNFINISHED_STATUSES]
+        for i in range(0, len(unfinished), MAX_FILTER_RUNS):
+            run_ids = ", ".join(f"'{run_id}'" for run_id in unfinished[i:i + MAX_FILTER_RUNS])
+            filters.append(with_filter(f"attributes.run_id IN ({run_ids})"))
+        return filters
@@ -1,13 +1,30 @@
 import argparse
 import datetime
+import json
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 
 import numpy as np
-from mlflow.tracking import MlflowClient
 
+from .downsample import HISTORY_DTYPE, RawHistoryWriter, make_downsampler_factory, to_history_array
+from .manifest import Manifest, get_scope
+from .tracking import iter_experiments, iter_runs, get_run_name_filter
 
-def parse_arguments():
+
+# Limits of the MLflow bulk history endpoint.
+BULK_MAX_RUNS = 100
+BULK_MAX_RESULTS = 25000
+BULK_ENDPOINT = "/ajax-api/2.0/mlflow/metrics/get-history-bulk"
+# Limit and endpoint of the sampled history, which is selected by the tracking server.
+INTERVAL_MAX_RESULTS = 2500
+INTERVAL_ENDPOINT = "/ajax-api/2.0/mlflow/metrics/get-history-bulk-interval"
+# The number of points in a single history request.
+HISTORY_PAGE_SIZE = 25000
+
+
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(
         description="Download MLflow metric timeseries for runs matching a regexp"
     )
@@ -16,7 +33,288 @@ def parse_arguments():
     parser.add_argument(
         "target", nargs="?", default=".", help="Destination folder (default: current directory)"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--format", choices=["arrays", "npz", "parquet", "npy"], default="arrays",
+        help="Output format: folder with a memory-mappable .npy array of (step, timestamp, value) for each metric "
+        "(arrays, default), npz archive with step, timestamp and value arrays (loaded into memory), parquet table "
+        "or legacy pickled dictionary of values (npy)"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=8, help="The number of concurrent requests to MLflow (default: 8)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Download only new and changed runs, recording downloaded runs in the destination folder"
+    )
+    parser.add_argument(
+        "--downsample", metavar="METHOD:ARG",
+        help="Downsample histories: points:<n> (sampled by the tracking server), or every:<n>, mean:<seconds>, "
+        "minmax:<seconds> and lttb:<points> (applied to the downloaded history)"
+    )
+    parser.add_argument(
+        "--raw", action="store_true",
+        help="Also save full histories as memory-mappable .npy files in the <run_id>-raw folder"
+    )
+    return parser.parse_args(argv)
+
+
+class HistoryDownloader:
+    """Download metric histories using the bulk API if possible and parallel requests otherwise.
+
+    Histories, which don't fit into a bulk response, are requested page by page. If the downsampler factory
+    is given, pages are downsampled and written to raw files as they arrive, so memory doesn't depend
+    on the history length. The whole history is still transferred in this case.
+
+    If max_points is given, at most this number of evenly spaced points of each history are selected by
+    the tracking server or the database, and only these points are transferred.
+    """
+    def __init__(self, client, jobs=8, make_downsampler=None, max_points=None):
+        self.client = client
+        self.pool = ThreadPoolExecutor(max_workers=jobs)
+        self.make_downsampler = make_downsampler
+        self.max_points = max_points
+        self.bulk_available = True
+        self.interval_available = True
+
+    def close(self):
+        self.pool.shutdown()
+
+    def download(self, keys_by_run, raw_paths=None):
+        """Download histories for a group of at most BULK_MAX_RUNS runs.
+
+        Args:
+            keys_by_run: Mapping from run ID to the list of metric names.
+            raw_paths: Mapping from (run ID, metric name) to the path of the raw history file.
+
+        Returns:
+            Mapping from run ID to a dictionary of histories (see HISTORY_DTYPE).
+        """
+        raw_paths = raw_paths or {}
+        run_ids_by_key = {}
+        for run_id, keys in keys_by_run.items():
+            for key in keys:
+                run_ids_by_key.setdefault(key, []).append(run_id)
+        results = {run_id: {} for run_id in keys_by_run}
+        if self.max_points is not None:
+            interval_futures = {key: self.pool.submit(self.get_history_interval, run_ids, key)
+                                for key, run_ids in run_ids_by_key.items()}
+            for key, future in interval_futures.items():
+                histories = future.result()
+                for run_id in run_ids_by_key[key]:
+                    results[run_id][key] = to_history_array(histories.get(run_id, []))
+            return results
+        bulk_futures = {key: self.pool.submit(self.get_history_bulk, run_ids, key)
+                        for key, run_ids in run_ids_by_key.items()}
+        futures = {}
+        for key, future in bulk_futures.items():
+            histories = future.result()
+            for run_id in run_ids_by_key[key]:
+                raw_path = raw_paths.get((run_id, key))
+                if histories is None:
+                    futures[(run_id, key)] = self.pool.submit(self.get_history, run_id, key, raw_path)
+                else:
+                    page = np.array(histories.get(run_id, []), dtype=HISTORY_DTYPE)
+                    results[run_id][key] = self.process([page], raw_path)
+        for (run_id, key), future in futures.items():
+            results[run_id][key] = future.result()
+        return results
+
+    def get_history(self, run_id, key, raw_path=None):
+        return self.process(self.iter_history_pages(run_id, key), raw_path)
+
+    def iter_history_pages(self, run_id, key):
+        """Request the history page by page.
+
+        Database stores return the whole history in a single page.
+        """
+        store = self.client._tracking_client.store
+        page_token = None
+        while True:
+            page = store.get_metric_history(run_id, key, max_results=HISTORY_PAGE_SIZE, page_token=page_token)
+            yield np.array([(m.step, m.timestamp, m.value) for m in page], dtype=HISTORY_DTYPE)
+            page_token = page.token
+            if not page_token:
+                break
+
+    def process(self, pages, raw_path=None):
+        """Downsample pages and write them to the raw file.
+
+        Returns:
+            History array sorted by step.
+        """
+        downsampler = self.make_downsampler() if self.make_downsampler is not None else None
+        writer = RawHistoryWriter(raw_path) if raw_path is not None else None
+        chunks = []
+        try:
+            for page in pages:
+                if writer is not None:
+                    writer.write(page)
+                if downsampler is not None:
+                    downsampler.update(page)
+                else:
+                    chunks.append(page)
+        finally:
+            if writer is not None:
+                writer.close()
+        if downsampler is not None:
+            return downsampler.result()
+        return to_history_array(np.concatenate(chunks) if chunks else [])
+
+    def get_history_bulk(self, run_ids, key):
+        """Get histories of multiple runs with a single request.
+
+        Returns:
+            Mapping from run ID to the list of (step, timestamp, value) or None if bulk request
+            is not supported or the result was truncated.
+        """
+        if not self.bulk_available:
+            return None
+        from mlflow.exceptions import MlflowException
+        from mlflow.utils.rest_utils import http_request, verify_rest_response
+
+        store = self.client._tracking_client.store
+        try:
+            if hasattr(store, "get_metric_history_bulk"):
+                # Database store.
+                metrics = [(m.run_id, m.step, m.timestamp, m.value)
+                           for m in store.get_metric_history_bulk(run_ids, key, BULK_MAX_RESULTS)]
+            elif hasattr(store, "get_host_creds"):
+                # Tracking server.
+                response = http_request(store.get_host_creds(), BULK_ENDPOINT, "GET",
+                                        params={"run_id": run_ids, "metric_key": key,
+                                                "max_results": BULK_MAX_RESULTS})
+                response = verify_rest_response(response, BULK_ENDPOINT).json()
+                metrics = [(m["run_id"], m["step"], m["timestamp"], m["value"])
+                           for m in response.get("metrics", [])]
+            else:
+                self.bulk_available = False
+                return None
+        except MlflowException:
+            self.bulk_available = False
+            return None
+        if len(metrics) >= BULK_MAX_RESULTS:
+            return None
+        histories = {}
+        for run_id, step, timestamp, value in metrics:
+            histories.setdefault(run_id, []).append((step, timestamp, value))
+        return histories
+
+    def get_history_interval(self, run_ids, key):
+        """Get at most max_points evenly spaced points of each history, including the first and the last ones.
+
+        The tracking server and database stores select points in the database. Other stores read whole histories.
+
+        Returns:
+            Mapping from run ID to the list of (step, timestamp, value).
+        """
+        from mlflow.exceptions import MlflowException
+        from mlflow.utils.rest_utils import http_request, verify_rest_response
+
+        store = self.client._tracking_client.store
+        metrics = None
+        if self.interval_available and hasattr(store, "get_host_creds"):
+            # Tracking server. The REST store reads whole histories instead of calling the endpoint.
+            try:
+                response = http_request(store.get_host_creds(), INTERVAL_ENDPOINT, "GET",
+                                        params={"run_ids": run_ids, "metric_key": key,
+                                                "max_results": self.max_points})
+                response = verify_rest_response(response, INTERVAL_ENDPOINT).json()
+                metrics = [(m["run_id"], m["step"], m["timestamp"], m["value"])
+                           for m in response.get("metrics", [])]
+            except MlflowException:
+                # Old servers don't have the endpoint.
+                self.interval_available = False
+        if metrics is None:
+            metrics = [(m.run_id, m.step, m.timestamp, m.value)
+                       for m in store.get_metric_history_bulk_interval(run_ids, key, self.max_points, None, None)]
+        histories = {}
+        for run_id, step, timestamp, value in metrics:
+            histories.setdefault(run_id, []).append((step, timestamp, value))
+        return histories
+
+
+def save_arrays(path, meta, histories):
+    """Save meta.json and a .npy file with the history array of each metric into the folder.
+
+    Arrays can be opened without pickle with np.load(path, mmap_mode="r").
+
+    Returns:
+        The list of written files.
+    """
+    os.makedirs(path, exist_ok=True)
+    paths = [os.path.join(path, "meta.json")]
+    with open(paths[0], "w") as fp:
+        json.dump(meta, fp)
+    for key, history in histories.items():
+        paths.append(os.path.join(path, quote(key, safe="") + ".npy"))
+        np.save(paths[-1], np.asarray(history, dtype=HISTORY_DTYPE))
+    return paths
+
+
+def save_npz(path, meta, histories):
+    """Save histories as separate step, timestamp and value arrays, which can be loaded without pickle.
+
+    Arrays of the archive are always read into memory.
+    """
+    arrays = {k: np.array(v) for k, v in meta.items()}
+    for key, history in histories.items():
+        for field in HISTORY_DTYPE.names:
+            arrays[f"{key}/{field}"] = history[field]
+    np.savez(path, **arrays)
+    return [path]
+
+
+def save_parquet(path, meta, histories):
+    """Save histories as a long table with key, step, timestamp and value columns."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output requires pyarrow")
+    keys = list(histories)
+    arrays = [histories[key] for key in keys]
+    merged = np.concatenate(arrays) if arrays else np.empty(0, dtype=HISTORY_DTYPE)
+    table = pa.table({
+        "key": pa.array(np.repeat(keys, [len(a) for a in arrays]).astype(str)).dictionary_encode(),
+        "step": merged["step"],
+        "timestamp": merged["timestamp"],
+        "value": merged["value"]
+    })
+    table = table.replace_schema_metadata(meta)
+    pq.write_table(table, path)
+    return [path]
+
+
+def save_npy(path, meta, histories):
+    """Save pickled dictionary of values (legacy format)."""
+    data = dict(meta)
+    for key, history in histories.items():
+        data[key] = history["value"]
+    np.save(path, data)
+    return [path]
+
+
+# Format -> (save function, the suffix of the output path).
+SAVERS = {
+    "arrays": (save_arrays, ""),
+    "npz": (save_npz, ".npz"),
+    "parquet": (save_parquet, ".parquet"),
+    "npy": (save_npy, ".npy")
+}
+
+
+def get_meta(run):
+    info = run.info
+    meta = {}
+    if info.start_time:
+        meta["start_time"] = datetime.datetime.fromtimestamp(
+            info.start_time / 1000, tz=datetime.timezone.utc
+        ).isoformat()
+    if info.end_time:
+        meta["end_time"] = datetime.datetime.fromtimestamp(
+            info.end_time / 1000, tz=datetime.timezone.utc
+        ).isoformat()
+    return meta
 
 
 def main(args):
@@ -24,47 +322,96 @@ def main(args):
     if tracking_uri is None:
         raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
 
+    from mlflow.tracking import MlflowClient
     client = MlflowClient(tracking_uri)
     run_pattern = re.compile(args.run_pattern)
     metric_pattern = re.compile(args.metric_pattern)
+    make_downsampler = None
+    max_points = None
+    if (args.downsample is not None) and args.downsample.startswith("points:"):
+        try:
+            max_points = int(args.downsample.partition(":")[2])
+        except ValueError:
+            raise ValueError(f"Expected points:<int>, got {args.downsample}")
+        if not 1 <= max_points <= INTERVAL_MAX_RESULTS:
+            raise ValueError(f"The number of points must be between 1 and {INTERVAL_MAX_RESULTS}, got {max_points}")
+        if args.raw:
+            raise ValueError("Raw histories can't be saved with points downsampling, which doesn't download them")
+    elif args.downsample is not None:
+        make_downsampler = make_downsampler_factory(args.downsample)
+    # Export options, which are recorded in the manifest. None matches records without the option.
+    options = {"format": args.format, "downsample": args.downsample, "raw": True if args.raw else None}
+
+    name_filter = get_run_name_filter(args.run_pattern)
+    manifest = Manifest(args.target, "plot") if args.incremental else None
+    scope = get_scope(run_pattern=args.run_pattern, metric_pattern=args.metric_pattern, **options)
+    try:
+        # Find runs and metrics.
+        runs = []
+        # Experiment ID -> the latest start time of listed runs.
+        listed = {}
+        experiments = list(iter_experiments(client))
+        for experiment in experiments:
+            if manifest is not None:
+                filters = manifest.get_filters(experiment.experiment_id, scope, name_filter)
+            else:
+                filters = name_filter
+            for run in iter_runs(client, [experiment.experiment_id], filters):
+                run_name = run.info.run_name or run.info.run_id
+                if not run_pattern.search(run_name):
+                    continue
+                experiment_id = experiment.experiment_id
+                listed[experiment_id] = max(listed.get(experiment_id, 0), run.info.start_time or 0)
+
+                metric_keys = [k for k in run.data.metrics if metric_pattern.search(k)]
+                if not metric_keys:
+                    print(f"No metrics for {run_name}")
+                    continue
+                if (manifest is not None) and manifest.is_unchanged(run, metric_keys=metric_keys, **options):
+                    continue
+                runs.append((experiment, run, metric_keys))
+
+        # Download histories in groups of runs.
+        save, suffix = SAVERS[args.format]
+        downloader = HistoryDownloader(client, jobs=args.jobs, make_downsampler=make_downsampler,
+                                       max_points=max_points)
+        try:
+            for i in range(0, len(runs), BULK_MAX_RUNS):
+                group = runs[i:i + BULK_MAX_RUNS]
+                run_dirs = {}
+                raw_paths = {}
+                for experiment, run, metric_keys in group:
+                    run_id = run.info.run_id
+                    run_dir = os.path.join(args.target, experiment.name, run.info.run_name or run_id)
+                    os.makedirs(run_dir, exist_ok=True)
+                    run_dirs[run_id] = run_dir
+                    if args.raw:
+                        raw_dir = os.path.join(run_dir, f"{run_id}-raw")
+                        os.makedirs(raw_dir, exist_ok=True)
+                        for key in metric_keys:
+                            raw_paths[(run_id, key)] = os.path.join(raw_dir, quote(key, safe="") + ".npy")
+                histories = downloader.download({run.info.run_id: metric_keys for _, run, metric_keys in group},
+                                                raw_paths=raw_paths)
+                for experiment, run, metric_keys in group:
+                    run_name = run.info.run_name or run.info.run_id
+                    print(run_name)
 
-    experiments = client.search_experiments()
-    for experiment in experiments:
-        runs = client.search_runs(experiment_ids=[experiment.experiment_id])
-        for run in runs:
-            run_name = run.info.run_name or run.info.run_id
-            if not run_pattern.search(run_name):
-                continue
-
-            metric_keys = [k for k in run.data.metrics if metric_pattern.search(k)]
-            if not metric_keys:
-                print(f"No metrics for {run_name}")
-                continue
-
-            print(run_name)
-
-            run_id = run.info.run_id
-            run_dir = os.path.join(args.target, experiment.name, run_name)
-            os.makedirs(run_dir, exist_ok=True)
-
-            info = run.info
-            data = {}
-            if info.start_time:
-                data["start_time"] = datetime.datetime.fromtimestamp(
-                    info.start_time / 1000, tz=datetime.timezone.utc
-                ).isoformat()
-            if info.end_time:
-                data["end_time"] = datetime.datetime.fromtimestamp(
-                    info.end_time / 1000, tz=datetime.timezone.utc
-                ).isoformat()
-            for key in metric_keys:
-                history = client.get_metric_history(run_id, key)
-                history.sort(key=lambda m: m.step)
-                data[key] = np.array([m.value for m in history])
-
-            out_path = os.path.join(run_dir, f"{run_id}.npy")
-            np.save(out_path, data)
-            print(out_path)
+                    run_id = run.info.run_id
+                    out_path = os.path.join(run_dirs[run_id], run_id + suffix)
+                    paths = save(out_path, get_meta(run), histories[run_id])
+                    if manifest is not None:
+                        paths = paths + [raw_paths[(run_id, key)] for key in metric_keys if args.raw]
+                        manifest.update(run, paths, metric_keys=metric_keys, **options)
+                    print(out_path)
+        finally:
+            downloader.close()
+        if manifest is not None:
+            # Runs of all experiments are written.
+            for experiment_id, start_time in listed.items():
+                manifest.update_listed(experiment_id, scope, start_time)
+    finally:
+        if manifest is not None:
+            manifest.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import time
+import types
+import uuid
+
+
+SPOOL_SUFFIX = ".jsonl"
+ARTIFACTS_SUFFIX = ".artifacts"
+
+
+def get_spool_path(root, run_id):
+    return os.path.join(root, run_id + SPOOL_SUFFIX)
+
+
+def get_artifacts_path(root, run_id):
+    return os.path.join(root, run_id + ARTIFACTS_SUFFIX)
+
+
+def list_spool_runs(root):
+    """Get IDs of spooled runs in the folder ordered by modification time."""
+    paths = [os.path.join(root, name) for name in os.listdir(root) if name.endswith(SPOOL_SUFFIX)]
+    paths.sort(key=os.path.getmtime)
+    return [os.path.basename(path)[:-len(SPOOL_SUFFIX)] for path in paths]
+
+
+def read_spool(path):
+    """Iterate over records of the spool file.
+
+    The incomplete last line of a file, which is still being written, is ignored. Malformed lines are skipped.
+    """
+    with open(path, "rb") as fp:
+        for line in fp:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class SpoolClient:
+    """Replacement of MLflow client, which appends run records to local files instead of sending them to the server.
+
+    Each run is stored in the <run_id>.jsonl file of the spool folder. The first line describes the run, next lines
+    contain batches of metrics, parameters and tags, copied artifacts and the final status. Run IDs are generated
+    locally. Spools are uploaded to MLflow with the "venik sync" command.
+
+    Only methods used for logging are supported.
+
+    Args:
+        root: Spool folder.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def __getattr__(self, name):
+        raise AttributeError(f"{name} is not supported in spool mode")
+
+    def create_run(self, experiment_name, parent_run_id=None, tags=None, run_name=None, start_time=None):
+        run_id = uuid.uuid4().hex
+        tags = dict(tags or {})
+        if run_name is not None:
+            tags["mlflow.runName"] = run_name
+        record = {
+            "type": "run",
+            "run_id": run_id,
+            "experiment_name": experiment_name,
+            "parent_run_id": parent_run_id,
+            "start_time": start_time or int(time.time() * 1000),
+            "tags": {k: str(v) for k, v in tags.items()}
+        }
+        with open(get_spool_path(self.root, run_id), "x") as fp:
+            fp.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return self.get_run(run_id)
+
+    def get_run(self, run_id):
+        """Collect the run from the spool. Metrics contain the latest values."""
+        info = types.SimpleNamespace(run_id=run_id, experiment_id=None, status="RUNNING",
+                                     start_time=None, end_time=None)
+        data = types.SimpleNamespace(metrics={}, params={}, tags={})
+        steps = {}
+        for record in read_spool(get_spool_path(self.root, run_id)):
+            if record["type"] == "run":
+                info.start_time = record["start_time"]
+                data.tags.update(record["tags"])
+            elif record["type"] == "batch":
+                for key, value, timestamp, step in record.get("metrics", []):
+                    if (step, timestamp) >= steps.get(key, (step, timestamp)):
+                        steps[key] = (step, timestamp)
+                        data.metrics[key] = value
+                data.params.update(record.get("params", []))
+                data.tags.update(record.get("tags", []))
+            elif record["type"] == "end":
+                info.status = record["status"]
+                info.end_time = record["end_time"]
+        return types.SimpleNamespace(info=info, data=data)
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=(), **kwargs):
+        record = {"type": "batch"}
+        if metrics:
+            record["metrics"] = [[m.key, m.value, m.timestamp, m.step] for m in metrics]
+        if params:
+            record["params"] = [[p.key, str(p.value)] for p in params]
+        if tags:
+            record["tags"] = [[t.key, str(t.value)] for t in tags]
+        self._append(run_id, record)
+
+    def log_metric(self, run_id, key, value, timestamp=None, step=None, **kwargs):
+        timestamp = timestamp or int(time.time() * 1000)
+        self._append(run_id, {"type": "batch", "metrics": [[key, value, timestamp, step or 0]]})
+
+    def log_param(self, run_id, key, value, **kwargs):
+        self._append(run_id, {"type": "batch", "params": [[key, str(value)]]})
+
+    def set_tag(self, run_id, key, value, **kwargs):
+        self._append(run_id, {"type": "batch", "tags": [[key, str(value)]]})
+
+    def log_artifact(self, run_id, local_path, artifact_path=None):
+        self._copy_artifact(run_id, local_path, artifact_path, directory=False)
+
+    def log_artifacts(self, run_id, local_dir, artifact_path=None):
+        self._copy_artifact(run_id, local_dir, artifact_path, directory=True)
+
+    def set_terminated(self, run_id, status=None, end_time=None):
+        self._append(run_id, {"type": "end",
+                              "status": status or "FINISHED",
+                              "end_time": end_time or int(time.time() * 1000)})
+
+    def _copy_artifact(self, run_id, local_path, artifact_path, directory):
+        # Files are copied, as the originals can be removed or overwritten before the upload.
+        target = os.path.join(get_artifacts_path(self.root, run_id), artifact_path or "")
+        if directory:
+            shutil.copytree(local_path, target, dirs_exist_ok=True)
+        else:
+            os.makedirs(target, exist_ok=True)
+            target = os.path.join(target, os.path.basename(local_path))
+            shutil.copy2(local_path, target)
+        self._append(run_id, {"type": "artifact",
+                              "path": os.path.relpath(target, self.root),
+                              "artifact_path": artifact_path,
+                              "directory": directory})
+
+    def _append(self, run_id, record):
+        path = get_spool_path(self.root, run_id)
+        if not os.path.exists(path):
+            raise KeyError(f"Spooled run not found: {run_id}")
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with open(path, "ab+") as fp:
+            if fp.tell() > 0:
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    # Finish the line, which was interrupted by a killed writer.
+                    line = "\n" + line
+            fp.write(line.encode())
@@ -0,0 +1,287 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+import sqlalchemy as sa
+
+from .utils import SWEEPS_TABLE, SweepDB, get_engine, get_optuna_storage
+
+
+# Columns of Optuna tables used by the status.
+OPTUNA_METADATA = sa.MetaData()
+STUDIES_TABLE = sa.Table(
+    "studies", OPTUNA_METADATA,
+    sa.Column("study_id", sa.Integer, primary_key=True),
+    sa.Column("study_name", sa.String(512))
+)
+STUDY_DIRECTIONS_TABLE = sa.Table(
+    "study_directions", OPTUNA_METADATA,
+    sa.Column("study_direction_id", sa.Integer, primary_key=True),
+    sa.Column("direction", sa.String(8)),
+    sa.Column("study_id", sa.Integer),
+    sa.Column("objective", sa.Integer)
+)
+TRIALS_TABLE = sa.Table(
+    "trials", OPTUNA_METADATA,
+    sa.Column("trial_id", sa.Integer, primary_key=True),
+    sa.Column("number", sa.Integer),
+    sa.Column("study_id", sa.Integer),
+    sa.Column("state", sa.String(8)),
+    sa.Column("datetime_start", sa.DateTime),
+    sa.Column("datetime_complete", sa.DateTime)
+)
+TRIAL_VALUES_TABLE = sa.Table(
+    "trial_values", OPTUNA_METADATA,
+    sa.Column("trial_value_id", sa.Integer, primary_key=True),
+    sa.Column("trial_id", sa.Integer),
+    sa.Column("objective", sa.Integer),
+    sa.Column("value", sa.Float),
+    sa.Column("value_type", sa.String(7))
+)
+TRIAL_PARAMS_TABLE = sa.Table(
+    "trial_params", OPTUNA_METADATA,
+    sa.Column("param_id", sa.Integer, primary_key=True),
+    sa.Column("trial_id", sa.Integer),
+    sa.Column("param_name", sa.String(512)),
+    sa.Column("param_value", sa.Float),
+    sa.Column("distribution_json", sa.Text)
+)
+
+STATES = ["COMPLETE", "RUNNING", "WAITING", "PRUNED", "FAIL"]
+INFINITE_VALUES = {"INF_POS": math.inf, "INF_NEG": -math.inf}
+# The maximum number of trial IDs in a single query.
+MAX_QUERY_TRIALS = 500
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser("Show sweep progress. Use environment variables for locating Optuna.")
+    parser.add_argument("sweep_id", help="Sweep ID")
+    parser.add_argument("--top", type=int, default=5, help="The number of best trials to show (default: 5)")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="Refresh the status with the given interval")
+    parser.add_argument("--export", metavar="DIR", help="Write history, parameter importance and plots to the folder")
+    args = parser.parse_args(argv)
+    return args
+
+
+def decode_param(value, distribution_json):
+    """Convert Optuna internal parameter representation into the parameter value."""
+    distribution = json.loads(distribution_json)
+    name = distribution["name"]
+    if name == "CategoricalDistribution":
+        return distribution["attributes"]["choices"][int(value)]
+    if name in ["IntDistribution", "IntUniformDistribution", "IntLogUniformDistribution"]:
+        return int(value)
+    return value
+
+
+def dominates(a, b):
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+class SweepStatus:
+    """Progress of the sweep, which is read from Optuna tables without loading the study.
+
+    Trial counts are computed with a single aggregated query. Values and parameters of completed trials
+    are requested incrementally: if the number of completed trials changed, IDs of completed trials are requested
+    and only unknown trials are read. Completion times are not used, as they are set by clocks of agent hosts.
+    """
+    def __init__(self, engine, sweep_id):
+        self.engine = engine
+        self.sweep_id = sweep_id
+        query = (sa.select(STUDIES_TABLE.c.study_id, STUDY_DIRECTIONS_TABLE.c.direction)
+                 .join(STUDY_DIRECTIONS_TABLE, STUDY_DIRECTIONS_TABLE.c.study_id == STUDIES_TABLE.c.study_id)
+                 .where(STUDIES_TABLE.c.study_name == sweep_id)
+                 .order_by(STUDY_DIRECTIONS_TABLE.c.objective))
+        with engine.connect() as conn:
+            rows = conn.execute(query).fetchall()
+        if not rows:
+            raise KeyError(f"Sweep not found: {sweep_id}")
+        self.study_id = rows[0].study_id
+        self.directions = [row.direction for row in rows]
+        self.counts = {}
+        # Status from the Sweeps table, like "active" or "exhausted".
+        self.sweep_status = None
+        # Trial ID -> trial dictionary with number, datetime_complete, values and params.
+        self.trials = {}
+
+    def update(self):
+        """Request trial counts and trials completed since the previous update."""
+        t = TRIALS_TABLE
+        v = TRIAL_VALUES_TABLE
+        p = TRIAL_PARAMS_TABLE
+        with self.engine.connect() as conn:
+            counts = conn.execute(sa.select(t.c.state, sa.func.count())
+                                  .where(t.c.study_id == self.study_id)
+                                  .group_by(t.c.state))
+            self.counts = {state: count for state, count in counts}
+            self.sweep_status = conn.execute(sa.select(SWEEPS_TABLE.c.status)
+                                             .where(SWEEPS_TABLE.c.sweep_id == self.sweep_id)).scalar()
+            if self.counts.get("COMPLETE", 0) == len(self.trials):
+                return
+
+            trial_ids = conn.execute(sa.select(t.c.trial_id)
+                                     .where((t.c.study_id == self.study_id) & (t.c.state == "COMPLETE"))).scalars()
+            missing = sorted(set(trial_ids) - set(self.trials))
+            new_trials = {}
+            for i in range(0, len(missing), MAX_QUERY_TRIALS):
+                selected = t.c.trial_id.in_(missing[i:i + MAX_QUERY_TRIALS])
+                rows = conn.execute(sa.select(t.c.trial_id, t.c.number, t.c.datetime_complete,
+                                              v.c.objective, v.c.value, v.c.value_type)
+                                    .join(v, v.c.trial_id == t.c.trial_id)
+                                    .where(selected))
+                for row in rows:
+                    trial = new_trials.setdefault(row.trial_id, {
+                        "number": row.number,
+                        "datetime_complete": row.datetime_complete,
+                        "values": [None] * len(self.directions),
+                        "params": {}
+                    })
+                    trial["values"][row.objective] = INFINITE_VALUES.get(row.value_type, row.value)
+                rows = conn.execute(sa.select(p.c.trial_id, p.c.param_name, p.c.param_value, p.c.distribution_json)
+                                    .join(t, t.c.trial_id == p.c.trial_id)
+                                    .where(selected))
+                for row in rows:
+                    if row.trial_id in new_trials:
+                        new_trials[row.trial_id]["params"][row.param_name] = (row.param_value, row.distribution_json)
+        self.trials.update(new_trials)
+
+    def get_history(self):
+        """Get completed trials ordered by number with the best values so far."""
+        signs = [1 if direction == "MINIMIZE" else -1 for direction in self.directions]
+        history = []
+        best = [math.inf] * len(signs)
+        for trial in sorted(self.trials.values(), key=lambda trial: trial["number"]):
+            best = [min(b, sign * value) for b, sign, value in zip(best, signs, trial["values"])]
+            history.append((trial, [sign * b for sign, b in zip(signs, best)]))
+        return history
+
+    def get_best_trials(self, top=5):
+        """Get the best trials for a single objective or the Pareto front for multiple objectives."""
+        signs = [1 if direction == "MINIMIZE" else -1 for direction in self.directions]
+
+        def key(trial):
+            return [sign * value for sign, value in zip(signs, trial["values"])]
+
+        trials = sorted(self.trials.values(), key=key)
+        if len(signs) == 1:
+            return trials[:top]
+        front = []
+        for trial in trials:
+            if not any(dominates(key(other), key(trial)) for other in front):
+                front.append(trial)
+        return front
+
+    def get_importances(self):
+        """Compute parameter importances for the first objective with Optuna evaluator."""
+        import optuna
+        from optuna.distributions import json_to_distribution
+
+        study = optuna.create_study(directions=[d.lower() for d in self.directions])
+        trials = []
+        for trial in self.trials.values():
+            if not trial["params"]:
+                continue
+            distributions = {name: json_to_distribution(distribution_json)
+                             for name, (_, distribution_json) in trial["params"].items()}
+            trials.append(optuna.trial.create_trial(
+                params={name: distributions[name].to_external_repr(value)
+                        for name, (value, _) in trial["params"].items()},
+                distributions=distributions,
+                values=trial["values"]
+            ))
+        study.add_trials(trials)
+        return optuna.importance.get_param_importances(study, target=lambda trial: trial.values[0])
+
+    def format(self, top=5):
+        lines = [f"Sweep: {self.sweep_id}" + (f" ({self.sweep_status})" if self.sweep_status else "")]
+        states = STATES + sorted(set(self.counts) - set(STATES))
+        lines.append("Trials: " + ", ".join(f"{state} {self.counts.get(state, 0)}" for state in states))
+        best_trials = self.get_best_trials(top=top)
+        if not best_trials:
+            return "\n".join(lines)
+        lines.append("Best trials:" if len(self.directions) == 1 else "Pareto front:")
+        for trial in best_trials:
+            values = ", ".join(f"{value:.6g}" for value in trial["values"])
+            params = " ".join(f"{name}={decode_param(value, distribution_json)}"
+                              for name, (value, distribution_json) in sorted(trial["params"].items()))
+            lines.append(f"  #{trial['number']}: {values}  {params}")
+        history = self.get_history()
+        last_improvement = 0
+        for i in range(1, len(history)):
+            if history[i][1] != history[i - 1][1]:
+                last_improvement = i
+        lines.append(f"Last improvement: trial #{history[last_improvement][0]['number']} "
+                     f"({len(history) - last_improvement - 1} completed trials ago)")
+        return "\n".join(lines)
+
+    def export(self, root):
+        """Write history and parameter importances as CSV files and plots if matplotlib is available."""
+        os.makedirs(root, exist_ok=True)
+        history = self.get_history()
+        objectives = [f"value_{i}" for i in range(len(self.directions))] if len(self.directions) > 1 else ["value"]
+        with open(os.path.join(root, "history.csv"), "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["number", "datetime_complete"] + objectives + ["best_" + name for name in objectives])
+            for trial, best in history:
+                writer.writerow([trial["number"], trial["datetime_complete"]] + trial["values"] + best)
+        importances = self.get_importances() if len(self.trials) > 1 else {}
+        with open(os.path.join(root, "importance.csv"), "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["parameter", "importance"])
+            writer.writerows(importances.items())
+
+        try:
+            import matplotlib
+            matplotlib.use("Agg")
+            import matplotlib.pyplot as plt
+        except ImportError:
+            print("Plots require matplotlib", file=sys.stderr)
+            return
+        fig, ax = plt.subplots()
+        numbers = [trial["number"] for trial, _ in history]
+        ax.scatter(numbers, [trial["values"][0] for trial, _ in history], s=8, alpha=0.5, label="value")
+        ax.plot(numbers, [best[0] for _, best in history], color="red", label="best")
+        ax.set_xlabel("Trial")
+        ax.set_ylabel(objectives[0])
+        ax.legend()
+        fig.savefig(os.path.join(root, "history.png"))
+        plt.close(fig)
+
+        fig, ax = plt.subplots()
+        names = list(importances)[::-1]
+        ax.barh(names, [importances[name] for name in names])
+        ax.set_xlabel("Importance")
+        fig.tight_layout()
+        fig.savefig(os.path.join(root, "importance.png"))
+        plt.close(fig)
+
+
+def main(args):
+    if not hasattr(get_optuna_storage(), "engine"):
+        raise RuntimeError("Status requires a database storage")
+    # Create or migrate Sweeps tables.
+    SweepDB()
+    status = SweepStatus(get_engine(), args.sweep_id)
+    try:
+        while True:
+            status.update()
+            if (args.watch is not None) and sys.stdout.isatty():
+                # Clear the screen.
+                print("\033[H\033[J", end="")
+            print(status.format(top=args.top), flush=True)
+            if args.export is not None:
+                status.export(args.export)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
@@ -1,21 +1,117 @@
 import argparse
-import optuna
+import datetime
 import os
 import random
 import string
+import time
 import yaml
-from mlflow.tracking import MlflowClient
 
-from .utils import SweepDB, get_optuna_storage, ParameterSampler
+from .utils import get_optuna_storage, get_sweep_db, get_sweep_metrics, make_pruner, make_sampler, ParameterSampler
 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser("Start sweep. Use environment variables for locating MLflow and Optuna.")
     parser.add_argument("config", help="Config path")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     return args
 
 
+def check_warm_start_metrics(db, sweep_ids, metrics):
+    """Check that previous sweeps optimize the same metrics with the same goals in the same order.
+
+    Raises:
+        ValueError if metrics of a sweep differ.
+    """
+    expected = [(metric["name"], metric["goal"]) for metric in metrics]
+    for sweep_id in sweep_ids:
+        try:
+            config = db.get_sweep_config(sweep_id)
+        except KeyError:
+            raise ValueError(f"Unknown warm start sweep: {sweep_id}")
+        source = [(metric["name"], metric["goal"]) for metric in get_sweep_metrics(config)]
+        if source != expected:
+            raise ValueError(f"Can't warm-start from {sweep_id}: sweep metrics {source} differ from {expected}")
+
+
+def get_warm_start_trials(storage, sweep_ids, distributions, n_objectives):
+    """Get completed trials of previous sweeps, which are compatible with the parameter distributions.
+
+    Parameters, which are missing in the distributions, are removed from trials.
+    Trials with missing parameters or with values outside the distributions are skipped.
+
+    Returns:
+        The list of frozen trials for the new study.
+    """
+    import optuna
+    from optuna.trial import TrialState
+
+    trials = []
+    for sweep_id in sweep_ids:
+        study = optuna.load_study(study_name=sweep_id, storage=storage)
+        n_copied = 0
+        for trial in study.get_trials(deepcopy=False, states=(TrialState.COMPLETE,)):
+            if (len(trial.values) != n_objectives) or (not set(distributions).issubset(trial.params)):
+                continue
+            try:
+                compatible = all(distribution._contains(distribution.to_internal_repr(trial.params[name]))
+                                 for name, distribution in distributions.items())
+            except ValueError:
+                compatible = False
+            if not compatible:
+                continue
+            trials.append(optuna.trial.create_trial(
+                params={name: trial.params[name] for name in distributions},
+                distributions=distributions,
+                values=trial.values,
+                user_attrs=dict(trial.user_attrs, warm_start_sweep_id=sweep_id, warm_start_number=trial.number),
+                intermediate_values=trial.intermediate_values
+            ))
+            n_copied += 1
+        print(f"Copy {n_copied} trials from {sweep_id}")
+    return trials
+
+
+BUDGET_KEYS = ["max_trials", "max_hours", "deadline", "cpu_hours"]
+
+
+def parse_budget(budget, now=None):
+    """Check the budget section of the sweep config and compute the deadline.
+
+    The deadline is the earliest of the deadline field (ISO 8601 time, UTC if the timezone is missing)
+    and max_hours after now.
+
+    Returns:
+        The budget with the deadline as string and the deadline as Unix timestamp or None.
+    """
+    budget = dict(budget)
+    unknown = set(budget) - set(BUDGET_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown budget fields: {', '.join(sorted(unknown))}")
+    for key in ["max_trials", "max_hours", "cpu_hours"]:
+        if (budget.get(key) is not None) and (budget[key] <= 0):
+            raise ValueError(f"Need positive budget {key}")
+    if (budget.get("max_trials") is not None) and (int(budget["max_trials"]) != budget["max_trials"]):
+        raise ValueError("Need integer budget max_trials")
+    now = time.time() if now is None else now
+    deadlines = []
+    if budget.get("max_hours") is not None:
+        deadlines.append(now + budget["max_hours"] * 3600)
+    if budget.get("deadline") is not None:
+        deadline = budget["deadline"]
+        # YAML parses unquoted timestamps.
+        if not isinstance(deadline, datetime.datetime):
+            deadline = str(deadline)
+            if deadline.endswith("Z"):
+                # Python before 3.11 doesn't parse the Z suffix.
+                deadline = deadline[:-1] + "+00:00"
+            deadline = datetime.datetime.fromisoformat(deadline)
+        if deadline.tzinfo is None:
+            deadline = deadline.replace(tzinfo=datetime.timezone.utc)
+        budget["deadline"] = deadline.isoformat()
+        deadlines.append(deadline.timestamp())
+    return budget, min(deadlines) if deadlines else None
+
+
 def init_sweep(args):
     with open(args.config, "r") as fp:
         config = yaml.safe_load(fp)
@@ -26,9 +122,28 @@ def init_sweep(args):
 
     # Check config.
     assert config["run_cap"] >= 0
-    assert config["method"] in ["bayes"]
-    assert config["metric"]["goal"] in ["maximize", "minimize"]
+    for key in ["trial_timeout", "heartbeat_interval", "grace_period"]:
+        if (config.get(key) is not None) and (config[key] <= 0):
+            raise ValueError(f"Need positive {key}")
+    metrics = get_sweep_metrics(config)
+    assert metrics
+    for metric in metrics:
+        assert metric["goal"] in ["maximize", "minimize"]
+    if (len(metrics) > 1) and (config.get("pruner") is not None):
+        raise ValueError("Pruning is not supported for multiple metrics")
+    if config.get("budget"):
+        config["budget"], deadline = parse_budget(config["budget"])
+        if deadline is not None:
+            config["_deadline_"] = deadline
     sampler = ParameterSampler(parameters=config["parameters"])
+    make_sampler(config)
+    make_pruner(config.get("pruner"))
+    warm_start = config.get("warm_start") or []
+    if isinstance(warm_start, str):
+        warm_start = [warm_start]
+
+    if warm_start:
+        check_warm_start_metrics(get_sweep_db(), warm_start, metrics)
 
     suffix = "".join([random.choice(string.ascii_letters) for _ in range(6)])
     sweep_id = config["project"] + "-" + config["name"] + "-" + suffix
@@ -37,6 +152,7 @@ def init_sweep(args):
     tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
     if tracking_uri is None:
         raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
+    from mlflow.tracking import MlflowClient
     client = MlflowClient(tracking_uri)
 
     experiment_name = config["project"]
@@ -51,15 +167,22 @@ def init_sweep(args):
 
     try:
         # Create sweep.
-        db = SweepDB()
-        if sweep_id in db.get_sweeps_list():
+        db = get_sweep_db()
+        if db.has_sweep(sweep_id):
             raise RuntimeError(f"Duplicate sweep: {sweep_id}")
         db.add_sweep(sweep_id, config)
         try:
             # Create study.
+            import optuna
             storage = get_optuna_storage()
+            trials = get_warm_start_trials(storage, warm_start, sampler.distributions, len(metrics))
             study = optuna.create_study(study_name=sweep_id, storage=storage,
-                                        direction=config["metric"]["goal"])
+                                        directions=[metric["goal"] for metric in metrics])
+            try:
+                study.add_trials(trials)
+            except Exception:
+                optuna.delete_study(study_name=sweep_id, storage=storage)
+                raise
         except Exception:
             db.del_sweep(sweep_id)
             raise
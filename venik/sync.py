@@ -0,0 +1,213 @@
+import argparse
+import os
+import shutil
+import time
+
+from .clients import MAX_BATCH_METRICS, MAX_BATCH_PARAMS, MAX_BATCH_TAGS
+from .spool import get_artifacts_path, get_spool_path, list_spool_runs, read_spool
+from .tracking import iter_experiments, iter_runs
+
+
+# Uploaded runs are marked with the spool run ID.
+SPOOL_RUN_ID_TAG = "venik.spool_run_id"
+# The number of uploaded spool items, which is updated together with each batch.
+SPOOL_OFFSET_TAG = "venik.spool_offset"
+PARENT_RUN_ID_TAG = "mlflow.parentRunId"
+# The maximum total number of metrics, parameters and tags in a single log_batch request.
+MAX_BATCH_SIZE = 1000
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser("Upload runs logged in spool mode. Use environment variables for locating MLflow.")
+    parser.add_argument("spool_dir", nargs="?", help="Spool folder (default: MLFLOW_SPOOL_DIR)")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="Repeat the upload with the given interval")
+    parser.add_argument("--delete", action="store_true", help="Delete spools of finished runs after the upload")
+    args = parser.parse_args(argv)
+    return args
+
+
+def iter_items(records):
+    """Flatten spool records into the sequence of (kind, item) pairs."""
+    for record in records:
+        if record["type"] == "batch":
+            for metric in record.get("metrics", []):
+                yield "metric", metric
+            for param in record.get("params", []):
+                yield "param", param
+            for tag in record.get("tags", []):
+                yield "tag", tag
+        elif record["type"] in ["artifact", "end"]:
+            yield record["type"], record
+
+
+class SpoolUploader:
+    """Replay spooled runs to MLflow.
+
+    Each run is created with the spool run ID tag and the number of uploaded items is saved in the same log_batch
+    request as the items themselves, so the upload can be interrupted and repeated without duplicating metrics.
+    Children of spooled runs are attached to the uploaded parents.
+    """
+    def __init__(self, client, root):
+        self.client = client
+        self.root = root
+        # Spool run ID -> MLflow run ID.
+        self.run_ids = {}
+        # Spool run ID -> spool size after the latest upload.
+        self._sizes = {}
+        # Parent run ID -> experiment ID.
+        self._experiments = {}
+
+    def sync_all(self, delete=False):
+        for spool_run_id in list_spool_runs(self.root):
+            if os.path.exists(get_spool_path(self.root, spool_run_id)):
+                self.sync(spool_run_id, delete=delete)
+
+    def sync(self, spool_run_id, delete=False):
+        """Upload new records of the spooled run.
+
+        Returns:
+            MLflow run ID.
+        """
+        path = get_spool_path(self.root, spool_run_id)
+        size = os.path.getsize(path)
+        if self._sizes.get(spool_run_id) == size:
+            return self.run_ids[spool_run_id]
+        records = read_spool(path)
+        start = next(records, None)
+        if (start is None) or (start["type"] != "run"):
+            # The spool was just created.
+            return None
+        parent_run_id = start.get("parent_run_id")
+        if parent_run_id is not None:
+            parent_run_id = self._get_parent(parent_run_id, delete=delete)
+            experiment_id = self._experiments.get(parent_run_id)
+            if experiment_id is None:
+                experiment_id = self.client.get_run(parent_run_id).info.experiment_id
+                self._experiments[parent_run_id] = experiment_id
+        else:
+            experiment = self.client.get_experiment_by_name(start["experiment_name"])
+            if experiment is not None:
+                experiment_id = experiment.experiment_id
+            else:
+                experiment_id = self.client.create_experiment(start["experiment_name"])
+
+        run = self._find_run(spool_run_id, [experiment_id])
+        if run is None:
+            tags = dict(start["tags"], **{SPOOL_RUN_ID_TAG: spool_run_id})
+            if parent_run_id is not None:
+                tags[PARENT_RUN_ID_TAG] = parent_run_id
+            run = self.client.create_run(experiment_id, start_time=start["start_time"], tags=tags)
+            offset = 0
+        else:
+            offset = int(run.data.tags.get(SPOOL_OFFSET_TAG, 0))
+        run_id = run.info.run_id
+        self.run_ids[spool_run_id] = run_id
+        finished = self._upload(run_id, iter_items(records), offset)
+        self._sizes[spool_run_id] = size
+        if finished and delete:
+            os.remove(path)
+            shutil.rmtree(get_artifacts_path(self.root, spool_run_id), ignore_errors=True)
+        return run_id
+
+    def _get_parent(self, parent_run_id, delete=False):
+        """Get MLflow ID of the parent run, which can be spooled."""
+        if os.path.exists(get_spool_path(self.root, parent_run_id)):
+            return self.sync(parent_run_id, delete=delete)
+        if parent_run_id in self.run_ids:
+            return self.run_ids[parent_run_id]
+        from mlflow.exceptions import MlflowException
+        try:
+            return self.client.get_run(parent_run_id).info.run_id
+        except MlflowException:
+            pass
+        # The spool of the parent was deleted after the upload.
+        experiment_ids = [e.experiment_id for e in iter_experiments(self.client)]
+        run = self._find_run(parent_run_id, experiment_ids)
+        if run is None:
+            raise KeyError(f"Parent run not found: {parent_run_id}")
+        self.run_ids[parent_run_id] = run.info.run_id
+        return run.info.run_id
+
+    def _find_run(self, spool_run_id, experiment_ids):
+        filter_string = f"tags.`{SPOOL_RUN_ID_TAG}` = '{spool_run_id}'"
+        return next(iter_runs(self.client, experiment_ids, filter_string), None)
+
+    def _upload(self, run_id, items, offset):
+        """Send items starting from the offset in large batches.
+
+        Returns:
+            True if the final status of the run was uploaded and False otherwise.
+        """
+        from mlflow.entities import Metric, Param, RunTag
+
+        metrics = []
+        params = {}
+        tags = {}
+        finished = False
+        position = 0
+        for position, (kind, item) in enumerate(items, 1):
+            if position <= offset:
+                finished = finished or (kind == "end")
+                continue
+            # Reserve a place for the offset tag.
+            full = len(metrics) + len(params) + len(tags) + 1 >= MAX_BATCH_SIZE
+            full = full or ((kind == "metric") and (len(metrics) >= MAX_BATCH_METRICS))
+            full = full or ((kind == "param") and (len(params) >= MAX_BATCH_PARAMS))
+            full = full or ((kind == "tag") and (len(tags) + 1 >= MAX_BATCH_TAGS))
+            if full or (kind in ["artifact", "end"]):
+                self._send(run_id, metrics, params, tags, position - 1)
+                metrics, params, tags = [], {}, {}
+            if kind == "metric":
+                key, value, timestamp, step = item
+                metrics.append(Metric(key, value, timestamp, step))
+            elif kind == "param":
+                params[item[0]] = Param(*item)
+            elif kind == "tag":
+                tags[item[0]] = RunTag(*item)
+            else:
+                if kind == "artifact":
+                    local_path = os.path.join(self.root, item["path"])
+                    if item["directory"]:
+                        self.client.log_artifacts(run_id, local_path, item["artifact_path"])
+                    else:
+                        self.client.log_artifact(run_id, local_path, item["artifact_path"])
+                else:
+                    self.client.set_terminated(run_id, item["status"], end_time=item["end_time"])
+                    finished = True
+                self.client.set_tag(run_id, SPOOL_OFFSET_TAG, str(position))
+        self._send(run_id, metrics, params, tags, position)
+        return finished
+
+    def _send(self, run_id, metrics, params, tags, offset):
+        if (not metrics) and (not params) and (not tags):
+            return
+        from mlflow.entities import RunTag
+
+        tags = list(tags.values()) + [RunTag(SPOOL_OFFSET_TAG, str(offset))]
+        self.client.log_batch(run_id, metrics=metrics, params=list(params.values()), tags=tags)
+
+
+def main(args):
+    tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
+    if tracking_uri is None:
+        raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
+    root = args.spool_dir or os.environ.get("MLFLOW_SPOOL_DIR", None)
+    if root is None:
+        raise RuntimeError("Need spool folder or MLFLOW_SPOOL_DIR environment variable")
+
+    from mlflow.tracking import MlflowClient
+    uploader = SpoolUploader(MlflowClient(tracking_uri), root)
+    try:
+        while True:
+            uploader.sync_all(delete=args.delete)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        pass
+    print(f"Uploaded runs: {len(uploader.run_ids)}")
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,66 @@
+import argparse
+import os
+import statistics
+
+from .utils import get_sweep_db
+
+
+METRIC_PREFIXES = ("timing/", "resource/")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser("Show time and resources spent by sweep trials. "
+                                     "Use environment variables for locating MLflow and Optuna.")
+    parser.add_argument("sweep_id", help="Sweep ID")
+    args = parser.parse_args(argv)
+    return args
+
+
+def get_summary(client, run_id):
+    """Summarize timing and resource metrics, logged to the parent run of the sweep.
+
+    Returns:
+        Mapping from metric name to a dictionary with count, total, mean, median and max.
+    """
+    run = client.get_run(run_id)
+    summary = {}
+    for key in sorted(run.data.metrics):
+        if not key.startswith(METRIC_PREFIXES):
+            continue
+        values = [m.value for m in client.get_metric_history(run_id, key)]
+        summary[key] = {
+            "count": len(values),
+            "total": sum(values),
+            "mean": statistics.mean(values),
+            "median": statistics.median(values),
+            "max": max(values)
+        }
+    return summary
+
+
+def main(args):
+    tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", None)
+    if tracking_uri is None:
+        raise RuntimeError("Need MLFLOW_TRACKING_URI environment variable")
+    sweep_config = get_sweep_db().get_sweep_config(args.sweep_id)
+
+    from mlflow.tracking import MlflowClient
+    client = MlflowClient(tracking_uri)
+    summary = get_summary(client, sweep_config["_parent_mlflow_run_id_"])
+    if not summary:
+        print("No timings")
+        return
+
+    # Share of each phase in the total time. Training time reported by the logger is a part of the run phase.
+    total_time = sum(v["total"] for k, v in summary.items() if k.startswith("timing/") and (k != "timing/train"))
+    width = max(map(len, summary))
+    columns = ["count", "total", "mean", "median", "max"]
+    print("metric".ljust(width), *[c.rjust(10) for c in columns], "share".rjust(7))
+    for key, values in summary.items():
+        share = f"{100 * values['total'] / total_time:6.1f}%" if key.startswith("timing/") and total_time else ""
+        print(key.ljust(width), f"{values['count']:10d}", *[f"{values[c]:10.3f}" for c in columns[1:]], share.rjust(7))
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)
@@ -0,0 +1,76 @@
+import functools
+
+
+SEARCH_PAGE_SIZE = 1000
+REGEXP_SPECIAL_CHARACTERS = set(".^$*+?{}[]\\|()")
+
+
+@functools.lru_cache(maxsize=None)
+def get_client(tracking_uri):
+    """Get the process-wide MLflow client for the tracking URI."""
+    from mlflow.tracking import MlflowClient
+    return MlflowClient(tracking_uri)
+
+
+def iter_experiments(client, page_size=SEARCH_PAGE_SIZE, **kwargs):
+    """Iterate over all experiments, requesting them page by page."""
+    page_token = None
+    while True:
+        experiments = client.search_experiments(max_results=page_size, page_token=page_token, **kwargs)
+        yield from experiments
+        page_token = experiments.token
+        if not page_token:
+            break
+
+
+def iter_runs(client, experiment_ids, filter_string="", page_size=SEARCH_PAGE_SIZE, **kwargs):
+    """Iterate over all runs matching the filter, requesting them page by page.
+
+    Args:
+        client: MLflow client.
+        experiment_ids: The list of experiment IDs.
+        filter_string: Filter or a list of filters. Runs matching any of them are returned once.
+        page_size: The number of runs per request.
+        kwargs: Extra search_runs arguments.
+    """
+    if not isinstance(filter_string, str):
+        seen = set()
+        for f in filter_string:
+            for run in iter_runs(client, experiment_ids, f, page_size=page_size, **kwargs):
+                if run.info.run_id not in seen:
+                    seen.add(run.info.run_id)
+                    yield run
+        return
+    page_token = None
+    while True:
+        runs = client.search_runs(experiment_ids=experiment_ids,
+                                  filter_string=filter_string,
+                                  max_results=page_size,
+                                  page_token=page_token,
+                                  **kwargs)
+        yield from runs
+        page_token = runs.token
+        if not page_token:
+            break
+
+
+def get_run_name_filter(pattern):
+    """Convert run name regexp into MLflow filter string.
+
+    Only literal patterns with optional ^ and $ anchors are converted.
+    The regexp must still be checked on the client side, as LIKE can be case-insensitive.
+
+    Returns:
+        Filter string or an empty string if the pattern can't be converted.
+    """
+    prefix = "%"
+    suffix = "%"
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+        prefix = ""
+    if pattern.endswith("$") and not pattern.endswith("\\$"):
+        pattern = pattern[:-1]
+        suffix = ""
+    if (not pattern) or (set(pattern) & REGEXP_SPECIAL_CHARACTERS) or (set(pattern) & set("%_'")):
+        return ""
+    return f"attributes.run_name LIKE '{prefix}{pattern}{suffix}'"
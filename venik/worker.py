@@ -0,0 +1,88 @@
+import argparse
+import gc
+import importlib
+import json
+import os
+import resource
+import sys
+import traceback
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser("Run sweep trials in a persistent process")
+    parser.add_argument("callable", help="Training function in the form module:function")
+    args = parser.parse_args(argv)
+    return args
+
+
+def load_callable(spec):
+    module_name, _, name = spec.partition(":")
+    if (not module_name) or (not name):
+        raise ValueError(f"Expected module:function, got {spec}")
+    result = importlib.import_module(module_name)
+    for part in name.split("."):
+        result = getattr(result, part)
+    return result
+
+
+def end_runs(status):
+    """End MLflow runs, which were left active by the trial."""
+    mlflow = sys.modules.get("mlflow", None)
+    if mlflow is None:
+        return
+    while mlflow.active_run() is not None:
+        mlflow.end_run(status)
+
+
+def get_cpu_time():
+    usages = [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+    return sum(usage.ru_utime for usage in usages), sum(usage.ru_stime for usage in usages)
+
+
+def main(args):
+    """Run trials from requests.
+
+    Each line of stdin is a JSON request with sampled args and trial environment variables.
+    The function is called with the dictionary of args, after that a JSON line with status is written to stdout.
+    Output of the function is redirected to stderr.
+    """
+    sys.path.insert(0, os.getcwd())
+    function = load_callable(args.callable)
+
+    sys.stdout.flush()
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    base_env = dict(os.environ)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        os.environ.clear()
+        os.environ.update(base_env)
+        os.environ.update(request.get("env", {}))
+        user_cpu, system_cpu = get_cpu_time()
+        try:
+            function(request["args"])
+            response = {"status": "ok"}
+        except Exception:
+            traceback.print_exc()
+            response = {"status": "error", "error": traceback.format_exc()}
+        user_cpu_end, system_cpu_end = get_cpu_time()
+        response["rusage"] = {
+            "resource/user_cpu": user_cpu_end - user_cpu,
+            "resource/system_cpu": system_cpu_end - system_cpu,
+            # Linux reports maximum RSS in kilobytes.
+            "resource/max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        end_runs("FINISHED" if response["status"] == "ok" else "FAILED")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        gc.collect()
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    main(args)